@@ -0,0 +1,214 @@
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import sys
+from multiprocessing import get_context
+from time import perf_counter
+
+import numpy as np
+
+from trafficsim import World, Message, naive_classifier
+from trafficsim.read import read_arrays
+from trafficsim.runner import seed_all
+
+BASELINE = 'benchmarks/baseline.json'
+SIZES = [10, 100, 1000, 5000]
+# metrics checked against the baseline, and whether higher is better
+CHECKED = {
+    'ticks_per_s': True,
+    'p50_ms': False,
+    'mean_us': False,
+    'peak_rss_mb': False,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark World.step and the simulation hot paths.')
+    parser.add_argument('--map', default='maps/map0_.jpg')
+    parser.add_argument('-n', '--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('-e', '--engines', nargs='+', default=['object', 'vector'],
+                        choices=['object', 'vector'])
+    parser.add_argument('-t', '--ticks', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative regression against the baseline')
+    return parser.parse_args()
+
+
+def peak_rss_mb():
+    # kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / (1 << 10)
+
+
+def latencies(times):
+    times = np.asarray(times)
+    return {
+        'p50_ms': float(np.percentile(times, 50)) * 1e3,
+        'p90_ms': float(np.percentile(times, 90)) * 1e3,
+        'p99_ms': float(np.percentile(times, 99)) * 1e3,
+    }
+
+
+def per_call(times):
+    times = np.asarray(times)
+    return {
+        'calls': len(times),
+        'mean_us': float(times.mean()) * 1e6,
+        'p99_us': float(np.percentile(times, 99)) * 1e6,
+    }
+
+
+def bench_step(map_file, n, engine, ticks, warmup, seed):
+    seed_all(seed)
+    world = World(map_file, n, engine=engine)
+    for _ in range(warmup):
+        world.step()
+    times = []
+    start = perf_counter()
+    for _ in range(ticks):
+        t = perf_counter()
+        world.step()
+        times.append(perf_counter() - t)
+    elapsed = perf_counter() - start
+    return dict(ticks_per_s=ticks / elapsed, **latencies(times), peak_rss_mb=peak_rss_mb())
+
+
+def bench_components(map_file, n, warmup, seed):
+    seed_all(seed)
+    world = World(map_file, n)
+    for _ in range(warmup):
+        world.step()
+
+    # the lookups update_position does: the road mask at the next position,
+    # and the nearest road pixel when that is off the road
+    def next_position(v):
+        return (v.position.x + round(v.speed * math.cos(v.direction)),
+                v.position.y + round(v.speed * math.sin(v.direction)))
+
+    results = {}
+    for name, call in [
+        ('Map.road', lambda v: world.map.road[next_position(v)[::-1]]),
+        ('Map.nearest_road', lambda v: world.map.nearest_road(*next_position(v))),
+        ('Vehicle.sense', lambda v: v.sense()),
+        ('Channel.broadcast', lambda v: world.channel.broadcast(
+            v, Message(v.id, 0, 'Benchmark', 500, False, v.position, v.direction))),
+    ]:
+        times = []
+        for vehicle in world.vehicles:
+            t = perf_counter()
+            call(vehicle)
+            times.append(perf_counter() - t)
+        results[name] = per_call(times)
+    return results
+
+
+def load_classifiers():
+    classifiers = {'naive': naive_classifier}
+    from trafficsim.KNN import KNN
+    from trafficsim.SVM import SVM
+    from trafficsim.NumpyANN import NumpyANN
+    classifiers['KNN'] = KNN(7).predict
+    classifiers['SVM'] = SVM().predict
+    classifiers['NumpyANN'] = NumpyANN().predict
+    try:
+        from trafficsim.ANN import ANN
+    except ImportError:
+        print('TensorFlow is not installed, skipping ANN')
+    else:
+        classifiers['ANN'] = ANN().predict
+    return classifiers
+
+
+def bench_classifiers(rows=200):
+    x_train, x_test, y_train, y_test = read_arrays()
+    data = np.asarray(x_test, dtype=float)[:rows]
+    results = {}
+    for name, predict in load_classifiers().items():
+        times = []
+        for row in data:
+            t = perf_counter()
+            predict(list(row))
+            times.append(perf_counter() - t)
+        results[f'{name}.predict'] = per_call(times)
+    return results
+
+
+# every case runs in a fresh process so that peak memory is its own
+def isolated(fn, *args):
+    with get_context('fork').Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(fn, args)
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for case, metrics in results.items():
+        for metric, higher_is_better in CHECKED.items():
+            if metric not in metrics or metric not in baseline.get(case, {}):
+                continue
+            old, new = baseline[case][metric], metrics[metric]
+            if higher_is_better:
+                regressed = new < old * (1 - threshold)
+            else:
+                regressed = new > old * (1 + threshold)
+            if regressed:
+                regressions.append(f'{case} {metric}: {old:.4g} -> {new:.4g}')
+    return regressions
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = {}
+
+    for engine in args.engines:
+        for n in args.sizes:
+            case = f'World.step/{engine}/{n}'
+            results[case] = isolated(bench_step, args.map, n, engine,
+                                     args.ticks, args.warmup, args.seed)
+            r = results[case]
+            print(f'{case:<28} {r["ticks_per_s"]:>9.1f} ticks/s  p50 {r["p50_ms"]:.3f}ms  '
+                  f'p99 {r["p99_ms"]:.3f}ms  peak {r["peak_rss_mb"]:.0f}MB')
+
+    for n in args.sizes:
+        for name, r in isolated(bench_components, args.map, n, args.warmup, args.seed).items():
+            case = f'{name}/{n}'
+            results[case] = r
+            print(f'{case:<28} {r["mean_us"]:>9.1f}us/call  p99 {r["p99_us"]:.1f}us')
+
+    for name, r in isolated(bench_classifiers).items():
+        results[name] = r
+        print(f'{name:<28} {r["mean_us"]:>9.1f}us/call  p99 {r["p99_us"]:.1f}us')
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'machine': platform.platform(),
+                'python': platform.python_version(),
+                'map': args.map,
+                'seed': args.seed,
+                'ticks': args.ticks,
+                'results': results,
+            }, f, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}:')
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print(f'No regressions beyond {args.threshold:.0%} against {args.baseline}')
+    else:
+        print(f'No baseline at {args.baseline}, run with --save to create one')
+        sys.exit(1)
@@ -0,0 +1,55 @@
+import argparse
+import os
+from glob import glob
+from itertools import product
+from multiprocessing import Pool
+from time import perf_counter
+
+from threadpoolctl import threadpool_limits
+
+from trafficsim.datagen import generate, write_manifest, MANIFEST
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Generate labelled message decisions for training the classifiers, '
+                    'running headless worlds across a process pool.')
+    parser.add_argument('--maps', nargs='+', default=sorted(glob('maps/*')))
+    parser.add_argument('-n', '--vehicles', nargs='+', type=int, default=[100, 500])
+    parser.add_argument('-s', '--seeds', nargs='+', type=int, default=list(range(8)))
+    parser.add_argument('-t', '--ticks', type=int, default=2000)
+    parser.add_argument('-e', '--engine', default='vector', choices=['object', 'vector'])
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('-o', '--out', default='dataset',
+                        help='directory for the shards and manifest.json')
+    parser.add_argument('--shard-rows', type=int, default=1 << 18)
+    return parser.parse_args()
+
+
+def init_worker():
+    threadpool_limits(1)
+
+
+def generate_one(params):
+    return generate(**params)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    grid = [dict(map_file=m, n_vehicles=n, seed=s, ticks=args.ticks, out_dir=args.out,
+                 engine=args.engine, shard_rows=args.shard_rows)
+            for m, n, s in product(args.maps, args.vehicles, args.seeds)]
+
+    t = perf_counter()
+    runs = []
+    with Pool(args.workers, init_worker) as pool:
+        for i, run in enumerate(pool.imap_unordered(generate_one, grid), 1):
+            runs.append(run)
+            status = f'{run["rows"]} rows' + (f' (stopped: {run["error"]})' if run['error'] else '')
+            print(f'[{i}/{len(grid)}] {run["map"]} n={run["n_vehicles"]} seed={run["seed"]}: {status}')
+
+    manifest = write_manifest(args.out, runs)
+    shards = sum(len(run['shards']) for run in runs)
+    print(f'{manifest["rows"]} rows in {shards} shards in {perf_counter() - t:.1f}s, '
+          f'written to {os.path.join(args.out, MANIFEST)}')
@@ -0,0 +1,68 @@
+import argparse
+
+from trafficsim.runner import run
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Run a traffic simulation without the OpenCV GUI.')
+    parser.add_argument('--map', default='maps/map0_.jpg')
+    parser.add_argument('-n', '--vehicles', type=int, default=5)
+    parser.add_argument('-c', '--classifier', default='naive',
+                        choices=['naive', 'KNN', 'SVM', 'ANN', 'NumpyANN'])
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('-t', '--ticks', type=int, default=1000)
+    parser.add_argument('-e', '--engine', default='object', choices=['object', 'vector'])
+    parser.add_argument('--spacing', type=float, default=0,
+                        help='spawn vehicles at least this many pixels apart')
+    parser.add_argument('--log', default=None,
+                        help='write message events to this file (disabled by default)')
+    parser.add_argument('--log-format', default='jsonl', choices=['jsonl', 'text'])
+    parser.add_argument('--cache', type=int, default=0, metavar='SIZE',
+                        help='memoize classifier decisions in an LRU of this size')
+    parser.add_argument('--profile', action='store_true',
+                        help='time the phases of World.step and count messages')
+    parser.add_argument('--video', default=None, metavar='PATH',
+                        help='record the run to this video file')
+    parser.add_argument('--render-every', type=int, default=1, metavar='N',
+                        help='write a video frame every N ticks')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--restore', default=None, metavar='PATH',
+                        help='continue from a snapshot instead of spawning a new world')
+    parser.add_argument('--snapshot', default=None, metavar='PATH',
+                        help='save the world to this file after the run')
+    parser.add_argument('--serve', type=int, default=None, metavar='PORT',
+                        help='accept commands on this local port while running (0 for any)')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='split the map into this many regions stepped in parallel (vector engine)')
+    parser.add_argument('--retrain', action='store_true',
+                        help='ignore the cached classifier and train it again')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    classifier = None if args.classifier == 'naive' else args.classifier
+    summary = run(args.map, args.vehicles, classifier, args.seed, args.ticks, args.engine,
+                  args.log, args.log_format, args.retrain, args.cache, args.profile,
+                  args.video, args.render_every, args.fps, args.restore, args.snapshot,
+                  args.spacing, args.serve, args.workers)
+
+    print(f'{summary["ticks"]} ticks in {summary["elapsed"]:.2f}s '
+          f'({summary["ticks_per_s"]:.1f} ticks/s, world loaded in {summary["load_time"]:.2f}s)')
+    print(f'map: {summary["map"]}  vehicles: {summary["n_vehicles"]}  '
+          f'classifier: {summary["classifier"]}  engine: {summary["engine"]}  seed: {summary["seed"]}')
+    print(f'broadcasts: {summary["broadcasts"]}  received: {summary["received"]}  '
+          f'broken: {summary["broken"]}  mean speed: {summary["mean_speed"]:.3f}')
+    if args.log:
+        print(f'log: {summary["log_written"]} events written to {args.log}, '
+              f'{summary["log_dropped"]} dropped by a full buffer')
+    if args.profile:
+        print(summary['profile'])
+    if args.snapshot:
+        print(f'saved the world at tick {summary["tick"]} to {args.snapshot}')
+    if args.video:
+        print(f'wrote {summary["frames"]} frames to {args.video}')
+    if args.cache:
+        print(f'classifier cache: {summary["cache_hits"]} hits  {summary["cache_misses"]} misses  '
+              f'{summary["cache_evictions"]} evictions')
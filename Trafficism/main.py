@@ -1,31 +1,58 @@
+import argparse
+
 from trafficsim import *
+from trafficsim.clock import Clock
+from trafficsim.control import Controller
 from threading import Thread
 
 
-def thread_main(world):
+def thread_main(world, clock):
     world.show_colors()
-    while not kill and cv2.waitKey(10):
-        world.step()
-        world.render()
+    # ticks, frames and commands from the prompt, until `end`
+    clock.run(stop=lambda: kill)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a traffic simulation in a window.')
+    parser.add_argument('--map', default='maps/map0_.jpg')
+    parser.add_argument('-n', '--vehicles', type=int, default=5)
+    parser.add_argument('-c', '--classifier', default='SVM',
+                        choices=['naive', 'KNN', 'SVM', 'ANN', 'NumpyANN'])
+    parser.add_argument('-e', '--engine', default='object', choices=['object', 'vector'])
+    parser.add_argument('--speed', type=float, default=1,
+                        help='times real time, 0 for as fast as possible')
+    parser.add_argument('--fps', type=float, default=30, help='frames drawn per second')
+    parser.add_argument('--paused', action='store_true')
+    return parser.parse_args()
+
+
+# a real-time factor, or max (or 0) for as fast as possible
+def speed_arg(value):
+    if value == 'max':
+        return None
+    return float(value) or None
+
 
 if __name__ == '__main__':
-    with open('log.txt', 'w') as f:
-        pass
-    MAP_FILE = 'maps/map0_.jpg'
+    args = parse_args()
+    MAP_FILE = args.map
     # colors = [(0, 0, 255),
     # (0, 255, 0),
     # (255, 0, 0),
     # (0, 255, 255),
     # (255, 0, 255),
     # (255, 255, 0)]
-    world = World(MAP_FILE, 5, 'SVM')
+    classifier = None if args.classifier == 'naive' else args.classifier
+    world = World(MAP_FILE, args.vehicles, classifier, args.engine, log=EventLog('log.txt'))
     # for i, c in enumerate(colors):
     #     if i == len(world.vehicles):
     #         break
     #     world.vehicles[i].color = c
+    controller = Controller(world, readers=1)
+    clock = Clock(world, args.speed or None, args.fps, controller, args.paused)
     kill = False
 
-    thread = Thread(target=thread_main, args=(world,))
+    thread = Thread(target=thread_main, args=(world, clock))
     thread.start()
 
     try:
@@ -34,37 +61,28 @@ if __name__ == '__main__':
             if command == 'end':
                 kill = True
                 break
+            elif command.split()[:1] in (['pause'], ['resume'], ['step'], ['speed'], ['fps'], ['rate']):
+                # pause, resume, step [n], speed <factor|max>, fps <n>, rate
+                op, *arg = command.split()
+                try:
+                    if op == 'pause':
+                        clock.pause()
+                    elif op == 'resume':
+                        clock.resume()
+                    elif op == 'step':
+                        clock.step(int(arg[0]) if arg else 1)
+                    elif op == 'speed':
+                        clock.set_speed(speed_arg(arg[0]))
+                    elif op == 'fps':
+                        clock.set_fps(float(arg[0]))
+                    print(clock.report())
+                except (IndexError, ValueError):
+                    print('Invalid command')
             elif command != '':
+                # get/set/rst/bd <vehicle|*|a,b> [param] [value], spawn n [spacing],
+                # state, save path, stats [on|off|reset]
                 try:
-                    op, veh, prm, val, *_ = (command.split()) + ['', '']
-                    print(op, veh, prm, val)
-                    veh = world.vehicles[int(veh)]
-                    prm_dict = {
-                        'a': 'acceleration',
-                        'mxa': 'MAX_ACCEL',
-                        'mna': 'MIN_ACCEL',
-                        's': 'speed',
-                        'mxs': 'MAX_SPEED',
-                        'mns': 'MIN_SPEED',
-                        'va': 'vehicle_ahead',
-                    }
-                    if val != '':
-                        val = float(val)
-
-                    if op == 'get':
-                        print(getattr(veh, prm_dict[prm]))
-                    elif op == 'set':
-                        if prm in {'a','s'}:
-                            setattr(veh, 'override_'+prm_dict[prm], True)
-                        setattr(veh, prm_dict[prm], val)
-                        print(f'set {prm_dict[prm]} to {val}')
-                    elif op == 'rst':
-                        veh.override_acceleration = False
-                        veh.override_speed = False
-                    elif op == 'bd':
-                        veh.break_down()
-                    else:
-                        exec(command)
+                    print(controller.call(command))
                 except Exception as e:
                     print(e)
                     print('Invalid command')
@@ -72,5 +90,6 @@ if __name__ == '__main__':
         kill = True
 
     thread.join()
+    world.close()
 
     cv2.destroyAllWindows()
@@ -0,0 +1,102 @@
+import argparse
+import csv
+import os
+from glob import glob
+from itertools import product
+from multiprocessing import Pool
+from statistics import mean
+from time import perf_counter
+
+from threadpoolctl import threadpool_limits
+
+from trafficsim.runner import run
+
+FIELDS = ['map', 'n_vehicles', 'classifier', 'engine', 'seed', 'ticks',
+          'load_time', 'elapsed', 'ticks_per_s', 'broadcasts', 'received',
+          'broken', 'mean_speed', 'error']
+GROUP = ['map', 'n_vehicles', 'classifier', 'engine', 'ticks']
+METRICS = ['ticks_per_s', 'load_time', 'broadcasts', 'received', 'broken', 'mean_speed']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Run a grid of headless simulations across a process pool.')
+    parser.add_argument('--maps', nargs='+', default=sorted(glob('maps/*')))
+    parser.add_argument('-n', '--vehicles', nargs='+', type=int, default=[10, 100])
+    parser.add_argument('-c', '--classifiers', nargs='+', default=['naive'],
+                        choices=['naive', 'KNN', 'SVM', 'ANN', 'NumpyANN'])
+    parser.add_argument('-s', '--seeds', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('-t', '--ticks', nargs='+', type=int, default=[1000])
+    parser.add_argument('-e', '--engine', default='vector', choices=['object', 'vector'])
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('-o', '--out', default='sweep.csv',
+                        help='one row per run')
+    parser.add_argument('--summary', default='sweep_summary.csv',
+                        help='runs aggregated over seeds')
+    return parser.parse_args()
+
+
+def init_worker():
+    # one core per worker, otherwise BLAS threads oversubscribe the box
+    threadpool_limits(1)
+
+
+def run_one(params):
+    classifier = None if params['classifier'] == 'naive' else params['classifier']
+    try:
+        result = run(params['map'], params['n_vehicles'], classifier,
+                     params['seed'], params['ticks'], params['engine'])
+        result['classifier'] = params['classifier']
+        result['error'] = ''
+        return result
+    except Exception as e:
+        return dict(params, error=repr(e))
+
+
+def aggregate(results):
+    groups = {}
+    for result in results:
+        if not result['error']:
+            groups.setdefault(tuple(result[k] for k in GROUP), []).append(result)
+    rows = []
+    for key, runs in sorted(groups.items()):
+        row = dict(zip(GROUP, key), runs=len(runs))
+        for metric in METRICS:
+            row[metric] = mean(r[metric] for r in runs)
+        rows.append(row)
+    return rows
+
+
+def sweep(grid, workers, out):
+    results = []
+    with open(out, 'w', newline='') as f, Pool(workers, init_worker) as pool:
+        writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for i, result in enumerate(pool.imap_unordered(run_one, grid), 1):
+            writer.writerow(result)
+            f.flush()
+            results.append(result)
+            status = result['error'] or f'{result["ticks_per_s"]:.1f} ticks/s'
+            print(f'[{i}/{len(grid)}] {result["map"]} n={result["n_vehicles"]} '
+                  f'{result["classifier"]} seed={result["seed"]}: {status}')
+    return results
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    grid = [dict(zip(['map', 'n_vehicles', 'classifier', 'seed', 'ticks'], p), engine=args.engine)
+            for p in product(args.maps, args.vehicles, args.classifiers, args.seeds, args.ticks)]
+
+    t = perf_counter()
+    results = sweep(grid, args.workers, args.out)
+    print(f'{len(grid)} runs on {args.workers} workers in {perf_counter() - t:.1f}s')
+
+    rows = aggregate(results)
+    with open(args.summary, 'w', newline='') as f:
+        writer = csv.DictWriter(f, GROUP + ['runs'] + METRICS)
+        writer.writeheader()
+        writer.writerows(rows)
+    for row in rows:
+        print(f'{row["map"]:<16} n={row["n_vehicles"]:<6} {row["classifier"]:<9} '
+              f'{row["ticks_per_s"]:>9.1f} ticks/s  broadcasts {row["broadcasts"]:.1f}  '
+              f'received {row["received"]:.1f}')
@@ -1,32 +1,33 @@
 from sklearn.neighbors import KNeighborsClassifier
-from .read import read_data
+from .model_cache import cached
+from .read import read_arrays, data_files
 import numpy as np
-from time import time
 
 
 class KNN:
 
-    def __init__(self, n_neighbors):
-        
-        x_train, x_test, y_train, y_test = read_data()
-        self.model = KNeighborsClassifier(n_neighbors=n_neighbors)
-        self.model.fit(x_train, y_train)
-        print(f'KNN completed training. Accuracy: {self.model.score(x_test, y_test)*100}%')
+    def __init__(self, n_neighbors, retrain=False, data='data.csv'):
+        (self.model, self.accuracy), hit = cached(
+            'KNN', {'n_neighbors': n_neighbors}, lambda: self.fit(n_neighbors, data),
+            data_files(data), retrain)
+        print(f'KNN {"loaded from cache" if hit else "completed training"}. Accuracy: {self.accuracy*100}%')
+
+    def fit(self, n_neighbors, data='data.csv'):
+        x_train, x_test, y_train, y_test = read_arrays(data)
+        model = KNeighborsClassifier(n_neighbors=n_neighbors)
+        model.fit(x_train, y_train)
+        return model, model.score(x_test, y_test)
 
     def predict(self, data):
         data = np.array(data).reshape(1, -1)
         return self.model.predict(data).flatten()
 
+    def predict_batch(self, data):
+        data = np.asarray(data, dtype=float).reshape(-1, 7)
+        return self.model.predict(data)
+
 
 if __name__ == '__main__':
-    X_train, X_test, Y_train, Y_test = read_data()
-    # for i in range(3, 27, 2):
-    #     knn = KNN(X_train, X_test, Y_train, Y_test, i)
-    knn = KNN(X_train, X_test, Y_train, Y_test, 7)
-
-    times = []
-    for i in range(X_train.shape[0]):
-        t = time()
-        knn.predict(X_train.iloc[i])
-        times.append(time()-t)
-    print(sum(times)/len(times))
\ No newline at end of file
+    # accuracy and predict timings on the shared split, see bench.py
+    from .bench import compare, table
+    print(table(compare(['KNN'])))
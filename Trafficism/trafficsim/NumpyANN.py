@@ -0,0 +1,71 @@
+import numpy as np
+from .model_cache import cached
+from .read import read_arrays
+
+CHECKPOINT_PATH = 'trafficsim/ANN/cp.ckpt'
+WEIGHTS_PATH = 'trafficsim/ANN/weights.npz'
+# keras.layers.BatchNormalization default
+BN_EPSILON = 1e-3
+
+
+# Folds each BatchNormalization into the Dense layer that follows it.
+# `layers` are the checkpoint variables of the ANN in order:
+# Dense(512), BatchNorm, Dense(128), BatchNorm, Dense(2).
+def fold_batch_norm(layers):
+    dense0, bn0, dense1, bn1, dense2 = [
+        {name: np.asarray(value, dtype=np.float64) for name, value in layer.items()}
+        for layer in layers]
+    weights = {'W0': dense0['kernel'], 'b0': dense0['bias']}
+    for i, bn, dense in ((1, bn0, dense1), (2, bn1, dense2)):
+        scale = bn['gamma'] / np.sqrt(bn['moving_variance'] + BN_EPSILON)
+        shift = bn['beta'] - bn['moving_mean'] * scale
+        weights[f'W{i}'] = scale[:, None] * dense['kernel']
+        weights[f'b{i}'] = shift @ dense['kernel'] + dense['bias']
+    return {name: value.astype(np.float32) for name, value in weights.items()}
+
+
+# Needs TensorFlow, but only to read the checkpoint once.
+def export(checkpoint_path=CHECKPOINT_PATH, weights_path=WEIGHTS_PATH):
+    import tensorflow as tf
+    reader = tf.train.load_checkpoint(checkpoint_path)
+    names = [['kernel', 'bias'],
+             ['gamma', 'beta', 'moving_mean', 'moving_variance']] * 2 + [['kernel', 'bias']]
+    layers = [{name: reader.get_tensor(f'layer_with_weights-{i}/{name}/.ATTRIBUTES/VARIABLE_VALUE')
+               for name in layer}
+              for i, layer in enumerate(names)]
+    np.savez(weights_path, **fold_batch_norm(layers))
+
+
+# Inference-only ANN: the network of ANN.py with BatchNorm folded into the
+# dense layers and dropout removed, evaluated in NumPy.
+class NumpyANN:
+
+    def __init__(self, weights_path=WEIGHTS_PATH):
+        with np.load(weights_path) as weights:
+            self.layers = [(weights[f'W{i}'], weights[f'b{i}']) for i in range(3)]
+        self.accuracy, _ = cached('NumpyANN', {}, self.evaluate,
+                                  data_files=('data.csv', weights_path))
+        print(f'NumpyANN Loaded. Accuracy: {self.accuracy}')
+
+    def logits(self, data):
+        h = np.asarray(data, dtype=np.float32).reshape(-1, 7)
+        for W, b in self.layers[:-1]:
+            h = np.maximum(h @ W + b, 0)
+        W, b = self.layers[-1]
+        return h @ W + b
+
+    def evaluate(self):
+        x_train, x_test, y_train, y_test = read_arrays()
+        return float(np.mean(self.predict_batch(x_test) == np.asarray(y_test)))
+
+    def predict(self, data):
+        return self.predict_batch(data)[0]
+
+    # round(sigmoid(z)) == 1 exactly when z > 0
+    def predict_batch(self, data):
+        return self.logits(data) > 0
+
+
+if __name__ == '__main__':
+    export()
+    print(f'Exported {CHECKPOINT_PATH} to {WEIGHTS_PATH}')
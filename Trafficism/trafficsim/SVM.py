@@ -1,32 +1,38 @@
 from sklearn.svm import SVC
-from .read import read_data
+from .model_cache import cached
+from .read import read_arrays, data_files
 import numpy as np
-from time import time
 
 
 class SVM:
 
-    def __init__(self):
-        
-        x_train, x_test, y_train, y_test = read_data()
-        self.model0 = SVC(kernel='linear')
-        self.model1 = SVC(kernel='linear')
-        self.model0.fit(x_train, y_train["useful"])
-        self.model1.fit(x_train, y_train["rebroadcast"])
+    def __init__(self, retrain=False, data='data.csv'):
+        (self.model0, self.model1, self.accuracy), hit = cached(
+            'SVM', {'kernel': 'linear'}, lambda: self.fit(data), data_files(data), retrain)
         print(
-            f'SVM completed training. Accuracy: {min(self.model0.score(x_test, y_test["useful"]), self.model1.score(x_test, y_test["rebroadcast"]))*100}%')
+            f'SVM {"loaded from cache" if hit else "completed training"}. Accuracy: {self.accuracy*100}%')
+
+    def fit(self, data='data.csv'):
+        x_train, x_test, y_train, y_test = read_arrays(data)
+        model0 = SVC(kernel='linear')
+        model1 = SVC(kernel='linear')
+        # columns: useful, rebroadcast
+        model0.fit(x_train, y_train[:, 0])
+        model1.fit(x_train, y_train[:, 1])
+        accuracy = min(model0.score(x_test, y_test[:, 0]),
+                       model1.score(x_test, y_test[:, 1]))
+        return model0, model1, accuracy
 
     def predict(self, data):
         data = np.array(data).reshape(1, -1)
         return [self.model0.predict(data)[0], self.model1.predict(data)[0]]
 
+    def predict_batch(self, data):
+        data = np.asarray(data, dtype=float).reshape(-1, 7)
+        return np.column_stack((self.model0.predict(data), self.model1.predict(data)))
+
 
 if __name__ == '__main__':
-    svm = SVM(X_train, X_test, Y_train, Y_test)
-    
-    times = []
-    for i in range(X_train.shape[0]):
-        t = time()
-        svm.predict(X_train.iloc[i])
-        times.append(time()-t)
-    print(sum(times)/len(times))
+    # accuracy and predict timings on the shared split, see bench.py
+    from .bench import compare, table
+    print(table(compare(['SVM'])))
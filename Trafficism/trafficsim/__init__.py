@@ -1,19 +1,36 @@
 import math
+import os
 import random
 from collections import namedtuple, deque
 
 import cv2
 import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+from .events import EventLog, NullLog
+from .queues import MessageQueue, RecentSet
+from .spatial import SpatialGrid
 
 ROAD_TYPES = {
     0: 'GOOD',
     1: 'BAD'
 }
 
+# compiled maps, see mapcache.py
+MAP_CACHE_DIR = 'trafficsim/compiled'
+
 Position = namedtuple('Position', ['x', 'y'])
 Message = namedtuple(
     'Message', ['veh_id', 'priority', 'data', 'radius', 'ack_req', 'position', 'direction'])
 
+# broadcast radius of each message type, indexed by priority
+MESSAGE_RADIUS = {
+    0: 500,  # Weather
+    1: 150,  # Bad Road
+    2: 100,  # Road Closed
+    3: 60,   # Slow Down
+}
+
 
 def angle_limit(angle):
     if angle > math.pi:
@@ -25,112 +42,271 @@ def angle_limit(angle):
 # {message.priority},{self.acceleration},{self.speed},{self.direction},{is_ahead},{same_heading},{dist},{useful},{rebroadcast}
 def naive_classifier(data):
     priority, acceleration, speed, direction, is_ahead, same_heading, dist = data
-    if in_range:
+    radius = MESSAGE_RADIUS[int(priority)]
+    if dist <= radius:
         if priority == 3 and not (is_ahead and same_heading):
             return False, False
-        return True, dist > message.radius * 0.5
+        return True, dist > radius * 0.5
     return False, False
 
+
+RADII = np.array([MESSAGE_RADIUS[p] for p in range(len(MESSAGE_RADIUS))])
+
+
+def naive_classifier_batch(data):
+    data = np.asarray(data, dtype=float).reshape(-1, 7)
+    priority, acceleration, speed, direction, is_ahead, same_heading, dist = data.T
+    radius = RADII[priority.astype(int)]
+    useful = (dist <= radius) & ~((priority == 3) & ~(
+        (is_ahead != 0) & (same_heading != 0)))
+    return np.column_stack((useful, useful & (dist > radius * 0.5)))
+
+
+# a directory is a tiled map, see tiles.py
+def open_map(map_file):
+    if os.path.isdir(map_file):
+        from .tiles import TiledMap
+        return TiledMap(map_file)
+    return Map(map_file)
+
+
+# Whether Map.heading finds a heading at each of many points, by trying the
+# window offsets for all points at a time. `road` is the road mask with the
+# window of (x, y) at road[y:y + 2r, x:x + 2r].
+def alignable(road, x, y, r=20):
+    corners = road.copy()
+    corners[1:-1, 1:-1] &= road[:-2, :-2] & road[:-2, 2:] & road[2:, :-2] & road[2:, 2:]
+    found = np.zeros(len(x), dtype=bool)
+    pending = np.arange(len(x))
+    for i in range(1, 2 * r - 1):
+        for j in range(1, 2 * r - 1):
+            if not len(pending):
+                return found
+            if not math.sqrt((r - j) ** 2 + (r - i) ** 2) > 0.8 * r:
+                continue
+            hit = corners[y[pending] + i, x[pending] + j]
+            found[pending[hit]] = True
+            pending = pending[~hit]
+    return found
+
+
 class World:
-    vehicles = []
 
-    def __init__(self, map_file, n_vehicles, classifier=None):
-        self.map = Map(map_file)
+    def __init__(self, map_file, n_vehicles, classifier=None, engine='object', log=None, retrain=False,
+                 cache=None, profile=False, spacing=0):
+        self.vehicles = []
+        self.log = NullLog() if log is None else log
+        self.map = open_map(map_file)
         self.channel = Channel(self)
         self.tick = 0
         self.render_broadcast = []
         self.render_receive = []
-        self.colors = np.ones((100, 100*n_vehicles, 3), dtype=np.uint8) * 255
+        self.renderer = None
+        # vehicles with messages in their inbox / outbox by id, and those that
+        # read messages last tick
+        self.receiving = {}
+        self.sending = {}
+        self.reading = []
+
+        self.load_classifier(classifier, retrain, cache)
+
+        if engine == 'object':
+            self.fleet = None
+            self.index = SpatialGrid()
+        elif engine == 'vector':
+            from .fleet import Fleet
+            self.fleet = Fleet(self)
+            self.index = self.fleet
+        else:
+            raise Exception()
+
+        self.spawn_vehicles(n_vehicles, spacing)
 
+        from .profiler import Profiler
+        self.profiler = Profiler(self)
+        if profile:
+            self.profiler.enable()
+
+    def load_classifier(self, classifier=None, retrain=False, cache=None):
+        # kept so that a restored snapshot can load the same classifier again
+        self.classifier_options = (classifier, retrain, cache)
         if classifier is None:
             self.classifier = naive_classifier
-        elif classifier == 'KNN':
-            print('Loading KNN model...')
-            from .KNN import KNN
-            self.classifier = KNN(7).predict
-        elif classifier == 'SVM':
-            print('Loading SVM model...')
-            from .SVM import SVM
-            self.classifier = SVM().predict
-        elif classifier == 'ANN':
-            print('Loading ANN model...')
-            from .ANN import ANN
-            self.classifier = ANN().predict
+            self.classify = naive_classifier_batch
         else:
-            raise Exception()
-
-        for _ in range(n_vehicles):
-            self.spawn_vehicle()
+            if classifier == 'KNN':
+                print('Loading KNN model...')
+                from .KNN import KNN
+                model = KNN(7, retrain)
+            elif classifier == 'SVM':
+                print('Loading SVM model...')
+                from .SVM import SVM
+                model = SVM(retrain)
+            elif classifier == 'ANN':
+                print('Loading ANN model...')
+                from .ANN import ANN
+                model = ANN(retrain=retrain)
+            elif classifier == 'NumpyANN':
+                print('Loading NumpyANN model...')
+                from .NumpyANN import NumpyANN
+                model = NumpyANN()
+            else:
+                raise Exception()
+            self.classifier = model.predict
+            self.classify = model.predict_batch
+
+        # cache: True or a dict of MemoClassifier options
+        if cache:
+            from .memo import MemoClassifier
+            self.cache = MemoClassifier(
+                self.classify, **({} if cache is True else cache))
+            self.classifier = self.cache.predict
+            self.classify = self.cache.predict_batch
+        else:
+            self.cache = None
+
+    # the classifier, log, renderer and profiler are not part of a snapshot
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ['classifier', 'classify', 'cache', 'log', 'renderer', 'profiler']:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = NullLog()
+        self.renderer = None
+        classifier, _, cache = self.classifier_options
+        self.load_classifier(classifier, False, cache)
+        from .profiler import Profiler
+        self.profiler = Profiler(self)
+
+    def save(self, path):
+        from .snapshot import save
+        save(self, path)
+
+    @staticmethod
+    def load(path, log=None):
+        from .snapshot import load
+        return load(path, log)
 
     def show_colors(self):
-        for i, vehicle in enumerate(self.vehicles):
-            cv2.circle(
-                self.colors,
-                (100*i+50, 50),
-                40,
-                vehicle.color,
-                -1
-            )
-        cv2.imshow('Colors', self.colors)
+        from .render import legend
+        cv2.imshow('Colors', legend(self.vehicles))
 
-    def spawn_vehicle(self):
-        vehicle = Vehicle(*random.choice(self.map.valid_points), self)
+    def add_vehicle(self, x, y, direction=None):
+        if self.fleet is None:
+            vehicle = Vehicle(x, y, self, direction)
+        else:
+            vehicle = self.fleet.spawn(x, y, direction)
         self.vehicles.append(vehicle)
+        self.index.insert(vehicle)
         return vehicle
 
+    # at a random point of the map's spawn table, aligned to the road by align
+    def spawn_vehicle(self):
+        return self.add_vehicle(*self.map.spawn_point(random.randrange(self.map.spawn_count())))
+
+    # Spawns n vehicles at once. With a spacing, the spawn table is walked in
+    # a random order and points closer than that to another vehicle skipped,
+    # so it only stops short of n once every point has been tried.
+    def spawn_vehicles(self, n, spacing=0):
+        if not spacing:
+            return [self.spawn_vehicle() for _ in range(n)]
+
+        count = self.map.spawn_count()
+        cell = math.ceil(spacing)
+        taken = {}
+        for vehicle in self.vehicles:
+            p, q = vehicle.position
+            taken.setdefault((p // cell, q // cell), []).append((p, q))
+        spawned = []
+        # lazy Fisher-Yates shuffle of the table indices
+        swapped = {}
+        for k in range(count):
+            if len(spawned) == n:
+                break
+            j = random.randrange(k, count)
+            i = swapped.get(j, j)
+            swapped[j] = swapped.get(k, k)
+            p, q = self.map.spawn_point(i)
+            cx, cy = p // cell, q // cell
+            if any((p - a) ** 2 + (q - b) ** 2 < spacing ** 2
+                   for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                   for a, b in taken.get((cx + dx, cy + dy), ())):
+                continue
+            taken.setdefault((cx, cy), []).append((p, q))
+            spawned.append(self.add_vehicle(p, q))
+        if len(spawned) < n:
+            print(f'Spawned only {len(spawned)} of {n} vehicles {spacing} apart')
+        return spawned
+
     def step(self):
         self.render_broadcast = []
         self.render_receive = []
         self.tick += 1
-        for vehicle in self.vehicles:
-            vehicle.read_message()
-        for vehicle in self.vehicles:
-            vehicle.step()
-
-    def render(self):
-        disp_map = self.map.map.copy()
-        for vehicle in self.vehicles:
-            cv2.arrowedLine(disp_map, vehicle.position, (round(vehicle.position.x + 20 * math.cos(
-                vehicle.direction)), round(vehicle.position.y + 20 * math.sin(vehicle.direction))), vehicle.color, 10)
-            cv2.circle(
-                disp_map,
-                tuple(vehicle.position),
-                3,
-                (0, 0, 0),
-                # vehicle.color,
-                -1
-            )
-            if vehicle in self.render_broadcast:
-                cv2.circle(
-                    disp_map,
-                    tuple(vehicle.position),
-                    self.channel.broadcast_radius,
-                    # (0, 0, 0),
-                    vehicle.color,
-                    2
-                )
-            for veh_id, veh in self.render_receive:
-                if veh is vehicle:
-                    cv2.circle(
-                        disp_map,
-                        tuple(vehicle.position),
-                        8,
-                        # (0, 0, 0),
-                        self.vehicles[veh_id].color,
-                        -1
-                    )
-                    break
-
-        cv2.imshow(self.map.map_file, disp_map)
+        # every vehicle reads up to two messages a tick, all classified at once
+        self.read_messages(2)
+        if self.fleet is None:
+            for vehicle in self.vehicles:
+                if vehicle.parked:
+                    vehicle.idle()
+                else:
+                    vehicle.drive()
+        else:
+            self.fleet.step()
+
+    # Only vehicles with messages waiting are visited, in id order; the rest
+    # would only find their inbox empty. Those that read last tick get their
+    # new_message cleared first, as reading an empty inbox would.
+    def read_messages(self, reads=1):
+        for vehicle in self.reading:
+            vehicle.new_message = None
+        self.reading = [self.receiving[i] for i in sorted(self.receiving)]
+        pending = []
+        for vehicle in self.reading:
+            for _ in range(reads):
+                pending.append((vehicle, vehicle.next_message()))
+            if not vehicle.inbox_size():
+                del self.receiving[vehicle.id]
+        rows = [vehicle.message_features(message)
+                for vehicle, message in pending if message is not None]
+        decisions = iter(self.classify(rows) if rows else ())
+        for vehicle, message in pending:
+            if message is None:
+                vehicle.new_message = None
+            else:
+                vehicle.handle_message(message, *next(decisions))
+
+    # every: draw every Nth tick, video: also write the frames to this file,
+    # show: False to record without a display
+    def start_renderer(self, every=1, video=None, fps=30, show=True):
+        from .render import Renderer
+        self.close_renderer()
+        self.renderer = Renderer(self, every, show, video, fps)
+        return self.renderer
+
+    def close_renderer(self):
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+
+    def render(self, force=False):
+        if self.renderer is None:
+            self.start_renderer()
+        self.renderer.render(force)
+
+    def close(self):
+        self.close_renderer()
+        self.log.close()
 
     def vehicle_ahead(self, vehicle, r=25):
-        r = r ** 2
-        for v in self.vehicles:
+        for v in self.index.near(vehicle.position, r):
             if v == vehicle or v.broken:
                 continue
             x = v.position.x-vehicle.position.x
             y = v.position.y-vehicle.position.y
-            if x**2 + y**2 < r and abs(angle_limit(v.direction - vehicle.direction)) < 1.8 and abs(angle_limit(math.atan2(y, x) - vehicle.direction)) < 1.8:
+            if x**2 + y**2 < r ** 2 and abs(angle_limit(v.direction - vehicle.direction)) < 1.8 and abs(angle_limit(math.atan2(y, x) - vehicle.direction)) < 1.8:
                 return True, v.id
         return False, None
 
@@ -144,7 +320,7 @@ class Channel:
 
     def broadcast(self, vehicle, message):
         self.world.render_broadcast.append(vehicle)
-        for v in self.vehicles:
+        for v in self.world.index.near(vehicle.position, self.broadcast_radius):
             if v is vehicle or (vehicle.position.x - v.position.x) ** 2 + (vehicle.position.y - v.position.y) ** 2 > self.broadcast_radius ** 2:
                 continue
             v.receive_message(message)
@@ -166,7 +342,17 @@ class Vehicle:
 
     ROAD_WIDTH = 8
 
-    def __init__(self, x, y, world):
+    # messages waiting to be read or sent, None for no limit
+    INBOX_CAPACITY = 32
+    OUTBOX_CAPACITY = 32
+    DROP_POLICY = 'lowest'
+    # ticks a received message is remembered to drop repeats of it, and
+    # before the same message can be broadcast again
+    RECEIVED_TTL = 1000
+    BROADCAST_INTERVAL = 1000
+
+    # direction: the heading to start with, found by align if not given
+    def __init__(self, x, y, world, direction=None):
         self._position = Position(x, y)
         self._speed = max(random.random(), self.MIN_SPEED)
         self._acceleration = 0
@@ -179,8 +365,8 @@ class Vehicle:
         self.comm = world.channel
         self._steer = 0
         self.prev_sensor = 0
-        self.__messages = []
-        self.__out_messages = []
+        self.__messages = MessageQueue(self.INBOX_CAPACITY, self.DROP_POLICY)
+        self.__out_messages = MessageQueue(self.OUTBOX_CAPACITY, self.DROP_POLICY)
         self.id = Vehicle.__ID
         self.override_acceleration = False
         self.override_speed = False
@@ -191,13 +377,18 @@ class Vehicle:
                      ]
         self.road_type = 0
         self.broken = False
+        # a parked vehicle is left where it is by World.step until woken
+        self.parked = False
         self.new_message = None
         self.slowing_down = False
-        self.prev_broadcasts = deque([(0, 0)]*5, 5)
-        self.received = deque([(0, 0)]*5, 5)
+        self.prev_broadcasts = RecentSet(self.BROADCAST_INTERVAL)
+        self.received = RecentSet(self.RECEIVED_TTL)
         Vehicle.__ID += 1
 
-        self.align()
+        if direction is None:
+            self.align()
+        else:
+            self.direction = direction
 
     @property
     def position(self):
@@ -240,20 +431,20 @@ class Vehicle:
     def vehicle_ahead(self):
         return self.world.vehicle_ahead(self)
 
-    def is_message_useful(self, message):
+    def message_features(self, message):
         x = message.position.x - self.position.x
         y = message.position.y - self.position.y
         dist = math.sqrt(x**2 + y**2)
-        useful = False
-        rebroadcast = False
-        in_range = dist <= message.radius
 
         is_ahead = abs(angle_limit(
             math.atan2(y, x) - self.direction)) < 1
         same_heading = abs(angle_limit(
             message.direction - self.direction)) < 1
 
-        return self.world.classifier([message.priority, self.acceleration, self.speed, self.direction, is_ahead, same_heading, dist])
+        return [message.priority, self.acceleration, self.speed, self.direction, is_ahead, same_heading, dist]
+
+    def is_message_useful(self, message):
+        return self.world.classifier(self.message_features(message))
 
         # if in_range:
         #     if message.data in ['Slow Down']:
@@ -278,74 +469,91 @@ class Vehicle:
         # return useful, rebroadcast
 
     def read_message(self):
-        if len(self.__messages) > 0:
+        message = self.next_message()
+        if message is None:
+            self.new_message = None
+        else:
+            self.handle_message(message, *self.is_message_useful(message))
+
+    # pops the next unseen message from the inbox, None if there is none;
+    # repeats of recently received messages are skipped
+    def next_message(self):
+        while len(self.__messages) > 0:
             message = self.__messages.pop()
             msg_data = (message.veh_id, message.priority,
                         message.data, message.position, message.direction)
-            if msg_data not in self.received:
-                self.received.appendleft(msg_data)
-                useful, rebroadcast = self.is_message_useful(message)
-                if useful:
-                    self.new_message = message
-                    self.world.render_receive.append((message.veh_id, self))
-                    if rebroadcast:
-                        self.re_broadcast_message(self.new_message)
-                    with open('log.txt', 'a') as f:
-                        f.write(
-                            f'Vehicle {self.id} received {self.new_message.data} from vehicle {self.new_message.veh_id} {"Rebroadcasting" if rebroadcast else ""}\n')
+            if self.received.add(msg_data, self.world.tick):
+                return message
+        return None
+
+    def handle_message(self, message, useful, rebroadcast):
+        if useful:
+            self.new_message = message
+            self.world.render_receive.append((message.veh_id, self))
+            if rebroadcast:
+                self.re_broadcast_message(self.new_message)
+            self.world.log.emit('received', self.world.tick, self.id, message.veh_id,
+                                message.data, message.priority, bool(rebroadcast))
 
-                else:
-                    self.new_message = None
-                    with open('log.txt', 'a') as f:
-                        f.write(
-                            f'Vehicle {self.id} discarded {message.data} from vehicle {message.veh_id}\n')
-
-            else:
-                self.new_message = None
         else:
             self.new_message = None
+            self.world.log.emit('discarded', self.world.tick, self.id, message.veh_id,
+                                message.data, message.priority)
+
+    def inbox_size(self):
+        return len(self.__messages)
+
+    def outbox_size(self):
+        return len(self.__out_messages)
 
     def receive_message(self, message):
-        self.__messages.append(message)
-        self.__messages.sort(key=lambda x: x.priority)
+        self.drop(self.__messages.push(message))
+        self.world.receiving[self.id] = self
+
+    def drop(self, message):
+        if message is not None:
+            self.world.log.emit('dropped', self.world.tick, self.id, message.veh_id,
+                                message.data, message.priority)
 
     def broadcast_message(self, priority, data, radius, ack_req=False):
         d = (priority, data, radius, ack_req)
-        for bc in self.prev_broadcasts:
-            if d == bc[0] and self.world.tick - bc[1] < 1000:
-                break
-        else:
+        if self.prev_broadcasts.add(d, self.world.tick):
             message = Message(self.id, priority, data, radius, ack_req,
                               self.position, self.direction)
-            self.__out_messages.append(message)
-            self.prev_broadcasts.appendleft(
-                (d, self.world.tick))
+            self.re_broadcast_message(message)
 
     def re_broadcast_message(self, message):
-        self.__out_messages.append(message)
+        self.drop(self.__out_messages.push(message))
+        self.world.sending[self.id] = self
 
     def broadcast(self):
         if len(self.__out_messages) > 0:
-            self.__out_messages.sort(key=lambda x: x.priority)
             message = self.__out_messages.pop()
             self.comm.broadcast(self, message)
-            with open('log.txt', 'a') as f:
-                f.write(
-                    f'Vehicle {self.id} broadcasted {message.data} with priority {message.priority}\n')
+            self.world.log.emit('broadcast', self.world.tick, self.id, message.veh_id,
+                                message.data, message.priority)
+        if not self.__out_messages:
+            self.world.sending.pop(self.id, None)
 
     def align(self):
-        r = 20
-        surroundings, _ = self.map.surroundings(self, r)
-
-        for point in surroundings:
-            if (point[0]+1, point[1]+1) in surroundings and (point[0]+1, point[1]-1) in surroundings and (point[0]-1, point[1]+1) in surroundings and (point[0]-1, point[1]-1) in surroundings and math.sqrt((r - point[0]) ** 2 + (r - point[1]) ** 2) > 0.8 * r:
-                self.direction = math.atan2(point[1] - r, point[0] - r)
-                break
-        else:
+        direction = self.map.heading(*self.position)
+        if direction is None:
             print('Spawn Error')
+        else:
+            self.direction = direction
 
     def step(self):
         self.read_message()
+        self.drive()
+
+    # a parked vehicle's tick: it relays what is in its outbox and still sends
+    # the weather every 1000 ticks, as event_tracker does
+    def idle(self):
+        if self.world.tick % 1000 == 0:
+            self.broadcast_message(0, 'Weather', 500)
+        self.broadcast()
+
+    def drive(self):
         self.update_direction()
         if not self.override_acceleration:
             self.update_acceleration()
@@ -370,7 +578,7 @@ class Vehicle:
         for i, item in enumerate(sensor):
             p = round(x + item[1] * math.cos(item[0]))
             q = round(y + item[1] * math.sin(item[0]))
-            sensor[i] = all(self.map.map[q, p] != [255, 255, 255])
+            sensor[i] = bool(self.map.sensor[q, p])
 
         turn_weights = [2, 1, 0, 1, 2]
         z = list(zip(turn_weights, sensor))
@@ -383,23 +591,19 @@ class Vehicle:
         self.direction += self.steer
 
     def update_position(self):
-        r = 10
-        surroundings, self.road_type = self.map.surroundings(self, r)
+        x, y = self.position
+        self.road_type = bool(self.map.bad[y, x])
         delta_new_position = Position(self.speed * math.cos(self.direction),
                                       self.speed * math.sin(self.direction))
-        if (round(delta_new_position.x + r), round(delta_new_position.y + r)) not in surroundings:
-            dist = 999999
-            new_point = delta_new_position
-            for point in surroundings:
-                d = (new_point.x - point[0] + r) ** 2 + \
-                    (new_point.y - point[1] + r) ** 2
-                if d < dist:
-                    dist = d
-                    new_point = Position(*point)
-            delta_new_position = Position(new_point.x - r, new_point.y - r)
+        p = x + round(delta_new_position.x)
+        q = y + round(delta_new_position.y)
+        if not self.map.road[q, p]:
+            p, q = self.map.nearest_road(p, q)
+            delta_new_position = Position(p - x, q - y)
 
         self._position = Position(self._position.x + delta_new_position.x,
                                   self._position.y + delta_new_position.y)
+        self.world.index.move(self)
 
     def update_speed(self):
         self.speed += self.acceleration * self.DELTA_TIME
@@ -455,14 +659,32 @@ class Vehicle:
         self.override_speed = True
         self._acceleration = 0
         self._speed = 0
+        self.parked = True
+
+    # drives again from the next tick, e.g. once its overrides are reset
+    def wake(self):
+        self.parked = False
 
 
 class Map:
     vehicles = []
 
-    def __init__(self, map_file):
+    # cache_dir: where compiled maps are kept (see mapcache), None to build
+    # the map from its image in this process
+    def __init__(self, map_file, cache_dir=MAP_CACHE_DIR):
         self.map_file = map_file
-        self.map = cv2.imread(map_file)
+        if cache_dir is None:
+            self.build()
+        else:
+            from .mapcache import load_map
+            layers = load_map(map_file, cache_dir)
+            for name in ['map', 'road', 'bad', 'sensor', 'nearest', 'valid_points']:
+                setattr(self, name, layers[name])
+            self.height, self.width = self.map.shape[:2]
+            self.spawns = layers['spawn_x'], layers['spawn_y']
+
+    def build(self):
+        self.map = cv2.imread(self.map_file)
         # if add_border:
         #     h, w = self.map.shape[0:2]
         #     base_size = h+20, w+20, 3
@@ -472,11 +694,68 @@ class Map:
         x, y, _ = np.where(self.map == (0, 0, 0))
         self.valid_points = list(set(zip(y, x)))
 
-    def surroundings(self, vehicle, r=10):
-        x, y = vehicle.position.x - r, vehicle.position.y - r
-        sub_map = self.map[y:y + 2 * r, x:x + 2 * r]
-        # cv2.imshow(str(vehicle.color), sub_map)
-        x, y, _ = np.where(sub_map != (255, 255, 255))
-        bad = all(self.map[vehicle.position.y, vehicle.position.x] == [0, 0, 253]) or all(self.map[vehicle.position.y,
-                                                                                                   vehicle.position.x] == [0, 0, 254]) or all(self.map[vehicle.position.y, vehicle.position.x] == [0, 0, 255])
-        return list(set(zip(y, x))), bad
+        self.height, self.width = self.map.shape[:2]
+        # any pixel that is not pure white can be driven on
+        self.road = np.any(self.map != 255, axis=-1)
+        # (0, 0, 253) to (0, 0, 255) mark bad road
+        self.bad = (self.map[..., 0] == 0) & (
+            self.map[..., 1] == 0) & (self.map[..., 2] >= 253)
+        # the vehicle sensors only see pixels without a saturated channel
+        self.sensor = np.all(self.map != 255, axis=-1)
+        # (row, column) of the closest road pixel to every pixel
+        self.nearest = distance_transform_edt(
+            ~self.road, return_distances=False, return_indices=True)
+        self.spawns = None
+
+    # The heading Vehicle.align gives a vehicle at (x, y): towards a road
+    # pixel of the (2r)^2 window that is more than 0.8 * r away and whose four
+    # diagonal neighbours are road in the window. Of those, the first in the
+    # iteration order of the set of the window's road pixels, which is the
+    # one align has always picked. None if there is no such pixel.
+    def heading(self, x, y, r=20):
+        window = np.asarray(self.road[y - r:y + r, x - r:x + r])
+        good = np.zeros_like(window)
+        good[1:-1, 1:-1] = window[1:-1, 1:-1] & window[:-2, :-2] & window[:-2, 2:] & \
+            window[2:, :-2] & window[2:, 2:]
+        i, j = np.indices(window.shape)
+        good &= np.sqrt((r - j) ** 2 + (r - i) ** 2) > 0.8 * r
+        q, p = np.nonzero(window)
+        for px, py in set(zip(p.tolist(), q.tolist())):
+            if good[py, px]:
+                return math.atan2(py - r, px - r)
+        return None
+
+    # (x, y) arrays of every valid point that a vehicle can be aligned at, in
+    # the order of valid_points. Computed once per map; align finds the
+    # heading of the points vehicles are spawned at.
+    def spawn_table(self, r=20):
+        if self.spawns is not None:
+            return self.spawns
+        x, y = np.array(self.valid_points, dtype=int).reshape(-1, 2).T
+        found = np.zeros(len(x), dtype=bool)
+        # windows starting left of or above the map wrap around in heading
+        edge = (x < r) | (y < r)
+        for k in np.flatnonzero(edge):
+            found[k] = self.heading(x[k], y[k], r) is not None
+        found[~edge] = alignable(np.pad(self.road, r), x[~edge], y[~edge], r)
+        self.spawns = x[found], y[found]
+        return self.spawns
+
+    def spawn_count(self):
+        return len(self.spawn_table()[0])
+
+    def spawn_point(self, i):
+        x, y = self.spawn_table()
+        return int(x[i]), int(y[i])
+
+    def nearest_road(self, x, y):
+        x = np.clip(x, 0, self.width - 1)
+        y = np.clip(y, 0, self.height - 1)
+        return self.nearest[1][y, x], self.nearest[0][y, x]
+
+    # snapshots only store the file, the image and masks are rebuilt from it
+    def __getstate__(self):
+        return {'map_file': self.map_file}
+
+    def __setstate__(self, state):
+        self.__init__(state['map_file'])
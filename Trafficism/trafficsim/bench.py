@@ -0,0 +1,142 @@
+import argparse
+import csv
+from time import perf_counter
+
+import numpy as np
+
+from . import naive_classifier_batch
+from .read import read_arrays
+
+POLICIES = ['naive', 'KNN', 'SVM', 'ANN', 'NumpyANN']
+BATCH_SIZES = [1, 32, 1024]
+HEADS = ['useful', 'rebroadcast']
+# policies that only load weights exported from the ANN trained on data.csv,
+# so they cannot be retrained and are always scored on the data.csv split
+LOAD_ONLY = {'NumpyANN'}
+
+
+# the batch predict of a policy, loaded (or trained) the way World does it
+def load(name, retrain=False, data='data.csv'):
+    if name == 'naive':
+        return naive_classifier_batch
+    if name == 'KNN':
+        from .KNN import KNN
+        return KNN(7, retrain, data).predict_batch
+    if name == 'SVM':
+        from .SVM import SVM
+        return SVM(retrain, data).predict_batch
+    if name == 'ANN':
+        from .ANN import ANN
+        return ANN(retrain=retrain, data=data).predict_batch
+    if name == 'NumpyANN':
+        from .NumpyANN import NumpyANN
+        return NumpyANN().predict_batch
+    raise Exception(f'Unknown policy {name!r}')
+
+
+# share of the test rows each head gets right, and both at once
+def accuracy(predict, x_test, y_test):
+    predicted = np.asarray(predict(x_test), dtype=bool).reshape(-1, 2)
+    correct = predicted == np.asarray(y_test, dtype=bool)
+    scores = {f'{head}_acc': float(correct[:, i].mean()) for i, head in enumerate(HEADS)}
+    scores['both_acc'] = float(correct.all(axis=1).mean())
+    return scores
+
+
+# latency of predicting `batch` rows at once, repeated for at least
+# `min_time` seconds and `min_calls` calls
+def timing(predict, rows, batch, min_time=0.5, min_calls=5):
+    data = np.resize(np.asarray(rows, dtype=float), (batch, rows.shape[1]))
+    predict(data)
+    times = []
+    start = perf_counter()
+    while len(times) < min_calls or perf_counter() - start < min_time:
+        t = perf_counter()
+        predict(data)
+        times.append(perf_counter() - t)
+    times = np.asarray(times)
+    return {
+        f'b{batch}_p50_us': float(np.percentile(times, 50)) * 1e6,
+        f'b{batch}_p99_us': float(np.percentile(times, 99)) * 1e6,
+        f'b{batch}_rows_per_s': batch / float(times.mean()),
+    }
+
+
+# One row per policy: load/train time, accuracy of both heads on the test
+# split of `data` and predict timings at each batch size. Policies that fail
+# to load, e.g. ANN without TensorFlow, get an error instead. A LOAD_ONLY
+# policy run with another `data` or `retrain` gets a note saying it was not.
+def compare(policies=POLICIES, batch_sizes=BATCH_SIZES, data='data.csv', retrain=False,
+            min_time=0.5):
+    splits = {data: read_arrays(data)}
+    results = []
+    for name in policies:
+        result = {'policy': name, 'error': '', 'note': ''}
+        source = data
+        if name in LOAD_ONLY:
+            source = 'data.csv'
+            if source not in splits:
+                splits[source] = read_arrays(source)
+            if data != source or retrain:
+                result['note'] = 'load-only, scored on data.csv'
+        x_train, x_test, y_train, y_test = splits[source]
+        t = perf_counter()
+        try:
+            predict = load(name, retrain, data)
+        except Exception as e:
+            result['error'] = repr(e)
+            results.append(result)
+            continue
+        result['load_s'] = perf_counter() - t
+        result.update(accuracy(predict, x_test, y_test))
+        for batch in batch_sizes:
+            result.update(timing(predict, x_test, batch, min_time))
+        results.append(result)
+    return results
+
+
+def table(results, batch_sizes=BATCH_SIZES):
+    header = f'{"policy":<10} {"load s":>8} {"useful":>7} {"rebroad":>7} {"both":>7}'
+    for batch in batch_sizes:
+        header += f' {f"b{batch} p50 us":>12} {f"b{batch} rows/s":>13}'
+    lines = [header, '-' * len(header)]
+    for r in results:
+        if r['error']:
+            lines.append(f'{r["policy"]:<10} {r["error"]}')
+            continue
+        line = (f'{r["policy"]:<10} {r["load_s"]:>8.2f} {r["useful_acc"]:>7.1%} '
+                f'{r["rebroadcast_acc"]:>7.1%} {r["both_acc"]:>7.1%}')
+        for batch in batch_sizes:
+            line += f' {r[f"b{batch}_p50_us"]:>12.1f} {r[f"b{batch}_rows_per_s"]:>13,.0f}'
+        if r['note']:
+            line += f'  ({r["note"]})'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare the message policies on accuracy, load time and predict speed.')
+    parser.add_argument('-c', '--classifiers', nargs='+', default=POLICIES, choices=POLICIES)
+    parser.add_argument('-b', '--batch-sizes', nargs='+', type=int, default=BATCH_SIZES)
+    parser.add_argument('--data', default='data.csv',
+                        help='data.csv or the manifest.json written by generate.py')
+    parser.add_argument('--retrain', action='store_true',
+                        help='train instead of loading from the model cache, to time training')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='seconds to time each batch size for')
+    parser.add_argument('-o', '--out', default=None, help='also write the results to this CSV')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # python -m trafficsim.bench -c naive KNN SVM NumpyANN
+    args = parse_args()
+    results = compare(args.classifiers, args.batch_sizes, args.data, args.retrain, args.min_time)
+    print(table(results, args.batch_sizes))
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, sorted({k for r in results for k in r},
+                                              key=lambda k: (k != 'policy', k)))
+            writer.writeheader()
+            writer.writerows(results)
@@ -0,0 +1,167 @@
+from threading import Event, Lock
+from time import perf_counter
+
+import cv2
+
+# simulated ticks in one second of simulated time: main.py used to wait 10ms
+# a tick, so speed 1 keeps the pace it always had
+TICKS_PER_SECOND = 100
+# a clock further behind than this stops trying to catch up
+MAX_LAG = 0.25
+
+
+# Runs a world on the wall clock. The simulation goes as fast as it can
+# (speed=None), at `speed` times real time, or not at all while paused apart
+# from single steps. Frames are drawn at their own target `fps` from whatever
+# tick the world is at; frames that fall due while a slow tick runs are
+# skipped rather than drawn late. Vehicle.DELTA_TIME stays 1, so a run gives
+# the same ticks at any speed.
+class Clock:
+
+    def __init__(self, world, speed=None, fps=30, controller=None, paused=False):
+        self.world = world
+        self.speed = speed
+        self.fps = fps
+        self.controller = controller
+        self.paused = paused
+        self.steps = 0
+        self.lock = Lock()
+        self.wake = Event()
+        self.ticks = 0
+        self.frames = 0
+        self.skipped = 0
+        self.tick_rate = 0.0
+        self.frame_rate = 0.0
+        self.next_tick = self.next_frame = None
+        self.window = None
+
+    def pause(self):
+        self.paused = True
+        self.wake.set()
+
+    def resume(self):
+        self.paused = False
+        self.wake.set()
+
+    # while paused, run n more ticks
+    def step(self, n=1):
+        with self.lock:
+            self.steps += n
+        self.wake.set()
+
+    # times real time, None for as fast as possible
+    def set_speed(self, speed):
+        self.speed = speed
+        self.next_tick = None
+        self.wake.set()
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.next_frame = None
+        self.wake.set()
+
+    def tick(self):
+        if self.controller is not None:
+            self.controller.apply()
+        self.world.step()
+        if self.controller is not None:
+            self.controller.publish()
+        self.ticks += 1
+
+    def frame(self):
+        self.world.render(force=True)
+        self.frames += 1
+        renderer = self.world.renderer
+        if renderer.show:
+            self.key(cv2.waitKey(1) & 0xFF)
+
+    # keys in the map window: space pauses, n steps, + and - double and halve
+    # the speed, 0 runs flat out and 1 at real time
+    def key(self, key):
+        if key == ord(' '):
+            self.resume() if self.paused else self.pause()
+        elif key == ord('n'):
+            self.step()
+        elif key in (ord('+'), ord('=')):
+            self.set_speed(None if self.speed is None else self.speed * 2)
+        elif key == ord('-'):
+            self.set_speed(max(self.tick_rate, 1) / TICKS_PER_SECOND / 2
+                           if self.speed is None else self.speed / 2)
+        elif key == ord('0'):
+            self.set_speed(None)
+        elif key == ord('1'):
+            self.set_speed(1)
+
+    # whether a tick is due now, or else when the next one is
+    def tick_due(self, now):
+        if self.paused:
+            with self.lock:
+                if self.steps:
+                    self.steps -= 1
+                    return True, None
+            return False, None
+        if self.speed is None:
+            return True, None
+        interval = 1 / (self.speed * TICKS_PER_SECOND)
+        if self.next_tick is None or now - self.next_tick > MAX_LAG:
+            self.next_tick = now
+        if now < self.next_tick:
+            return False, self.next_tick
+        self.next_tick += interval
+        return True, None
+
+    def frame_due(self, now):
+        if not self.fps:
+            return False, None
+        if self.next_frame is None:
+            self.next_frame = now
+        if now < self.next_frame:
+            return False, self.next_frame
+        interval = 1 / self.fps
+        behind = int((now - self.next_frame) / interval)
+        self.skipped += behind
+        self.next_frame += (behind + 1) * interval
+        return True, None
+
+    # achieved rates over the last second or so
+    def measure(self, now):
+        if self.window is None:
+            self.window = now, self.ticks, self.frames
+            return
+        start, ticks, frames = self.window
+        if now - start >= 1:
+            self.tick_rate = (self.ticks - ticks) / (now - start)
+            self.frame_rate = (self.frames - frames) / (now - start)
+            self.window = now, self.ticks, self.frames
+            renderer = self.world.renderer
+            if renderer is not None and renderer.show:
+                cv2.setWindowTitle(self.world.map.map_file, f'{self.world.map.map_file}  {self.report()}')
+
+    # runs until stop() is true or `ticks` more ticks have run
+    def run(self, stop=lambda: False, ticks=None):
+        end = None if ticks is None else self.ticks + ticks
+        while not stop() and (end is None or self.ticks < end):
+            now = perf_counter()
+            self.measure(now)
+            ticked, next_tick = self.tick_due(now)
+            if ticked:
+                self.tick()
+                now = perf_counter()
+            elif self.controller is not None:
+                # commands still go through while paused
+                self.controller.apply()
+            drawn, next_frame = self.frame_due(now)
+            if drawn:
+                self.frame()
+            if not (ticked or drawn):
+                waits = [t for t in (next_tick, next_frame) if t is not None]
+                timeout = min(waits) - perf_counter() if waits else 0.01
+                if timeout > 0:
+                    self.wake.wait(timeout)
+                self.wake.clear()
+
+    def report(self):
+        speed = 'max' if self.speed is None else f'{self.speed:g}x'
+        state = 'paused' if self.paused else speed
+        return (f'{self.tick_rate:.1f} ticks/s  {self.frame_rate:.1f} fps  '
+                f'({state}, tick {self.world.tick}, {self.skipped} frames skipped)')
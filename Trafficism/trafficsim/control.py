@@ -0,0 +1,238 @@
+import asyncio
+import json
+import queue
+import shlex
+from concurrent.futures import Future
+from threading import Thread
+
+# the short parameter names of the main.py prompt
+PARAMS = {
+    'a': 'acceleration',
+    'mxa': 'MAX_ACCEL',
+    'mna': 'MIN_ACCEL',
+    's': 'speed',
+    'mxs': 'MAX_SPEED',
+    'mns': 'MIN_SPEED',
+    'va': 'vehicle_ahead',
+}
+# parameters kept in the per-tick state, the rest are read between ticks
+STATE = ['x', 'y', 'direction', 'speed', 'acceleration', 'broken', 'parked',
+         'override_acceleration', 'override_speed',
+         'MAX_SPEED', 'MIN_SPEED', 'MAX_ACCEL', 'MIN_ACCEL']
+# ops that change the world
+WRITES = {'set', 'rst', 'bd', 'spawn', 'save', 'stats'}
+
+
+# Turns a prompt line ("set 3 s 0.5", "bd 1,2,3", "get * mxs") or a JSON
+# object into a command dict with op, vehicles, param and value.
+def parse(line):
+    line = line.strip()
+    if line.startswith('{'):
+        command = json.loads(line)
+    else:
+        op, *args = shlex.split(line) or ['']
+        command = {'op': op}
+        if op == 'spawn':
+            command['n'] = int(args[0])
+            command['spacing'] = float(args[1]) if len(args) > 1 else 0
+        elif op == 'save':
+            command['path'] = args[0]
+        elif op == 'stats':
+            command['action'] = args[0] if args else None
+        elif op != 'state':
+            command['vehicles'] = args[0] if args else '*'
+            if len(args) > 1:
+                command['param'] = args[1]
+            if len(args) > 2:
+                command['value'] = float(args[2])
+    if command['op'] not in WRITES | {'get', 'state'}:
+        raise Exception(f'Unknown command {command["op"]!r}')
+    return command
+
+
+# "*" for every vehicle, an index, or a comma separated list of them
+def select(vehicles, count):
+    if vehicles == '*':
+        return list(range(count))
+    if isinstance(vehicles, int):
+        return [vehicles]
+    if isinstance(vehicles, str):
+        vehicles = vehicles.split(',')
+    return [int(v) for v in vehicles]
+
+
+# Applies commands to a world between ticks. Any thread can submit a command
+# and wait on the returned Future; the simulation thread calls apply before a
+# tick and publish after it, so commands never see a half-finished tick. Reads
+# of the published state are answered straight away without waiting.
+class Controller:
+
+    # readers: how many clients may read the state; it is only built while
+    # there are any
+    def __init__(self, world, readers=0):
+        self.world = world
+        self.commands = queue.SimpleQueue()
+        self.state = None
+        self.readers = readers
+        self.publish(force=True)
+
+    def submit(self, command):
+        future = Future()
+        if isinstance(command, str):
+            try:
+                command = parse(command)
+            except Exception as e:
+                future.set_exception(e)
+                return future
+        if command['op'] == 'state' or (
+                command['op'] == 'get' and PARAMS.get(command.get('param'), command.get('param')) in STATE):
+            try:
+                future.set_result(self.read(command))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            self.commands.put((command, future))
+        return future
+
+    def call(self, command, timeout=None):
+        return self.submit(command).result(timeout)
+
+    # the state is published again before any command returns, so a client
+    # reading after its own write sees it
+    def apply(self):
+        done = []
+        while True:
+            try:
+                command, future = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                try:
+                    done.append((future, self.execute(command), None))
+                except Exception as e:
+                    done.append((future, None, e))
+        if not done:
+            return
+        self.publish(force=True)
+        for future, result, error in done:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def publish(self, force=False):
+        if not (self.readers or force):
+            return
+        vehicles = []
+        for v in self.world.vehicles:
+            row = {'id': v.id}
+            for name in STATE:
+                value = getattr(v, name) if name not in ('x', 'y') else getattr(v.position, name)
+                row[name] = bool(value) if isinstance(value, bool) else float(value)
+            vehicles.append(row)
+        # replaced in one assignment, readers see the old or the new state
+        self.state = {'tick': self.world.tick, 'vehicles': vehicles}
+
+    def read(self, command):
+        state = self.state
+        if command['op'] == 'state':
+            return state
+        param = PARAMS.get(command['param'], command['param'])
+        vehicles = state['vehicles']
+        return {i: vehicles[i][param] for i in select(command['vehicles'], len(vehicles))}
+
+    def execute(self, command):
+        world = self.world
+        op = command['op']
+        if op == 'spawn':
+            return [v.id for v in world.spawn_vehicles(command['n'], command.get('spacing', 0))]
+        if op == 'save':
+            world.save(command['path'])
+            return command['path']
+        if op == 'stats':
+            # the profiler patches methods the tick calls, so it is only
+            # switched between ticks
+            action = command.get('action')
+            if action == 'on':
+                world.profiler.enable()
+            elif action == 'off':
+                world.profiler.disable()
+            elif action == 'reset':
+                world.profiler.reset()
+            elif action is not None:
+                raise Exception(f'Unknown stats action {action!r}')
+            return world.profiler.report()
+
+        result = {}
+        for i in select(command['vehicles'], len(world.vehicles)):
+            vehicle = world.vehicles[i]
+            param = PARAMS.get(command.get('param'), command.get('param'))
+            if op == 'get':
+                result[i] = getattr(vehicle, param)
+            elif op == 'set':
+                # a parked vehicle drives again once told to do anything
+                vehicle.wake()
+                if param in ('acceleration', 'speed'):
+                    setattr(vehicle, 'override_' + param, True)
+                setattr(vehicle, param, command['value'])
+                result[i] = getattr(vehicle, param)
+            elif op == 'rst':
+                vehicle.wake()
+                vehicle.override_acceleration = False
+                vehicle.override_speed = False
+            elif op == 'bd':
+                vehicle.break_down()
+        return result
+
+
+# Serves a Controller on a local TCP socket from an asyncio loop in its own
+# thread. Clients send one command per line, as in the main.py prompt or as
+# JSON, and get one JSON line back: {"ok": true, "result": ...} or
+# {"ok": false, "error": "..."}.
+class Server:
+
+    def __init__(self, controller, host='127.0.0.1', port=8765):
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.thread = None
+
+    async def handle(self, reader, writer):
+        self.controller.readers += 1
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                try:
+                    future = self.controller.submit(line.decode())
+                    reply = {'ok': True, 'result': await asyncio.wrap_future(future)}
+                except Exception as e:
+                    reply = {'ok': False, 'error': str(e)}
+                writer.write((json.dumps(reply, default=str) + '\n').encode())
+                await writer.drain()
+        finally:
+            self.controller.readers -= 1
+            writer.close()
+
+    async def serve(self, started):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        started.set_result(self.port)
+        async with server:
+            await self.stopped.wait()
+
+    # returns the port, useful with port=0
+    def start(self):
+        started = Future()
+        self.thread = Thread(target=asyncio.run, args=(self.serve(started),), daemon=True)
+        self.thread.start()
+        return started.result()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join()
+            self.loop = None
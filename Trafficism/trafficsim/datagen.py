@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import World, naive_classifier_batch
+from .runner import seed_all
+
+# the columns of data.csv and their dtypes in the shards
+COLUMNS = {
+    'priority': np.int8,
+    'acceleration': np.float64,
+    'speed': np.float64,
+    'direction': np.float64,
+    'is_ahead': bool,
+    'same_heading': bool,
+    'dist': np.float64,
+    'useful': bool,
+    'rebroadcast': bool,
+}
+MANIFEST = 'manifest.json'
+
+
+# Stands in for World.classify: labels every message decision with the
+# rule-based policy and writes the features and labels to .npz shards of
+# `shard_rows` rows, one array per column.
+class ShardWriter:
+
+    def __init__(self, out_dir, prefix, shard_rows=1 << 18, policy=naive_classifier_batch):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.shard_rows = shard_rows
+        self.policy = policy
+        self.features = []
+        self.labels = []
+        self.pending = 0
+        self.shards = []
+
+    def __call__(self, data):
+        data = np.asarray(data, dtype=float).reshape(-1, 7)
+        decisions = self.policy(data)
+        self.features.append(data)
+        self.labels.append(np.asarray(decisions, dtype=bool))
+        self.pending += len(data)
+        if self.pending >= self.shard_rows:
+            self.flush()
+        return decisions
+
+    def flush(self):
+        if not self.pending:
+            return
+        table = np.column_stack((np.concatenate(self.features), np.concatenate(self.labels)))
+        self.features, self.labels, self.pending = [], [], 0
+        for start in range(0, len(table), self.shard_rows):
+            rows = table[start:start + self.shard_rows]
+            name = f'{self.prefix}-{len(self.shards):04d}.npz'
+            np.savez_compressed(os.path.join(self.out_dir, name), **{
+                column: rows[:, i].astype(dtype) for i, (column, dtype) in enumerate(COLUMNS.items())})
+            self.shards.append({'file': name, 'rows': len(rows)})
+
+
+# runs one world and returns a record of it and its shards for the manifest;
+# a run that fails part way keeps the rows labelled until then
+def generate(map_file, n_vehicles, seed, ticks, out_dir, engine='vector', shard_rows=1 << 18):
+    seed_all(seed)
+    # maps differing only in extension or directory get shards of their own
+    path = hashlib.sha1(os.path.abspath(map_file).encode()).hexdigest()[:8]
+    stem, ext = os.path.splitext(os.path.basename(map_file))
+    writer = ShardWriter(out_dir, f'{stem}{ext.replace(".", "-")}-{path}-n{n_vehicles}-s{seed}',
+                         shard_rows)
+    error = ''
+    try:
+        world = World(map_file, n_vehicles, engine=engine)
+        world.classify = writer
+        for _ in range(ticks):
+            world.step()
+        world.close()
+    except Exception as e:
+        error = repr(e)
+    writer.flush()
+    return {'map': map_file, 'n_vehicles': n_vehicles, 'seed': seed, 'ticks': ticks,
+            'engine': engine, 'rows': sum(shard['rows'] for shard in writer.shards),
+            'error': error, 'shards': writer.shards}
+
+
+def write_manifest(out_dir, runs):
+    manifest = {
+        'columns': {column: np.dtype(dtype).name for column, dtype in COLUMNS.items()},
+        'rows': sum(run['rows'] for run in runs),
+        'runs': runs,
+    }
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def shard_files(manifest_path):
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    root = os.path.dirname(manifest_path)
+    return [os.path.join(root, shard['file'])
+            for run in manifest['runs'] for shard in run['shards']]
+
+
+# all shards of a manifest as one DataFrame with the columns of data.csv
+def load_dataset(manifest_path):
+    frames = []
+    for path in shard_files(manifest_path):
+        with np.load(path) as shard:
+            frames.append(pd.DataFrame({column: shard[column] for column in COLUMNS}))
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,247 @@
+import sys
+from multiprocessing import Pipe, Process
+from operator import itemgetter
+
+import numpy as np
+
+from . import World, Channel
+from .fleet import angle_limit
+
+# how far apart two vehicles can be for one to be ahead of the other, the r
+# of World.vehicle_ahead and Fleet.vehicles_ahead
+AHEAD_RADIUS = 25
+
+
+# the directions Fleet.advance will check what is ahead with next tick
+def next_direction(fleet):
+    n = fleet.n
+    direction = fleet.direction[:n]
+    return np.where(fleet.parked[:n], direction, angle_limit(direction + fleet.steer[:n]))
+
+
+# Channel of a region: broadcasts are collected during the tick and delivered
+# together with those of the neighbouring regions once every region is done,
+# in the order of the senders' ids so each inbox fills up as it would in one
+# process.
+class DeferredChannel(Channel):
+
+    def __init__(self, world, broadcast_radius=200):
+        super().__init__(world)
+        self.broadcast_radius = broadcast_radius
+        self.sent = []
+
+    def broadcast(self, vehicle, message):
+        self.world.render_broadcast.append(vehicle)
+        self.sent.append((vehicle.id, vehicle.position, message))
+
+    def deliver(self, sent):
+        r = self.broadcast_radius
+        for veh_id, position, message in sorted(sent, key=itemgetter(0)):
+            for v in self.world.index.near(position, r):
+                if v.id == veh_id or (position.x - v.position.x) ** 2 + (position.y - v.position.y) ** 2 > r ** 2:
+                    continue
+                v.receive_message(message)
+
+
+# The vehicles of one vertical strip of the map, x0 <= x < x1, stepped in a
+# worker process with the vector engine.
+class Region:
+
+    def __init__(self, map_file, classifier_options, broadcast_radius, tick, x0, x1, records):
+        classifier, _, cache = classifier_options
+        self.world = World(map_file, 0, classifier, 'vector', cache=cache)
+        self.world.tick = tick
+        self.world.channel = DeferredChannel(self.world, broadcast_radius)
+        self.fleet = self.world.fleet
+        self.fleet.adopt(records)
+        self.x0, self.x1 = x0, x1
+
+    # first half of a tick: everything up to the broadcasts, which are
+    # returned for the other regions
+    def advance(self, arrivals, ghosts):
+        self.fleet.adopt(arrivals)
+        self.fleet.ghosts = ghosts
+        self.world.channel.sent = []
+        self.world.step()
+        self.fleet.ghosts = None
+        return self.world.channel.sent
+
+    # second half: deliver the broadcasts sent from in and near the region,
+    # then hand over the vehicles that left it. Also returns the vehicles
+    # other regions may need to see next tick.
+    def settle(self, sent):
+        channel = self.world.channel
+        channel.deliver(channel.sent + sent)
+        fleet = self.fleet
+        n = fleet.n
+        px, py = np.rint(fleet.x[:n]), np.rint(fleet.y[:n])
+        leaving = (px < self.x0) | (px >= self.x1)
+        band = leaving | (px < self.x0 + AHEAD_RADIUS) | (px >= self.x1 - AHEAD_RADIUS)
+        direction = next_direction(fleet)
+        ghosts = px[band], py[band], direction[band], fleet.broken[:n][band].copy()
+        counts = len(self.world.render_broadcast), len(self.world.render_receive)
+        return fleet.take(np.flatnonzero(leaving)), ghosts, counts
+
+    def collect(self):
+        return self.fleet.take(range(self.fleet.n))
+
+
+def serve(conn, *args):
+    from threadpoolctl import threadpool_limits
+    # one core per region, otherwise BLAS threads oversubscribe the box
+    threadpool_limits(1)
+    region = None
+    while True:
+        op, *params = conn.recv()
+        if op == 'stop':
+            break
+        try:
+            if region is None:
+                region = Region(*args)
+            conn.send((True, getattr(region, op)(*params)))
+        except Exception as e:
+            conn.send((False, repr(e)))
+    conn.close()
+
+
+# Steps one large vector-engine World across worker processes, each owning
+# a strip of the map with about the same number of vehicles. A tick takes
+# two exchanges: the broadcasts sent near each strip go to its region, then
+# the vehicles that crossed a boundary are handed over along with the
+# positions of those close enough to be ahead of another region's. Nothing
+# in a tick is random and the vehicles move from the state at its start, so
+# the result is the same as stepping the World in one process. The strips are
+# cut at the quantiles of the vehicles' x when Domains starts and are never
+# rebalanced, so a run whose traffic drifts across the map ends up with some
+# workers doing most of the work.
+class Domains:
+
+    def __init__(self, world, workers):
+        if world.fleet is None:
+            raise Exception('Regions need the vector engine')
+        self.world = world
+        fleet = world.fleet
+        n = fleet.n
+        px = np.rint(fleet.x[:n])
+        self.edges = np.unique(np.round(np.quantile(px, np.arange(1, workers) / workers))) \
+            if n else np.array([])
+        bounds = np.concatenate(([-np.inf], self.edges, [np.inf]))
+        self.bounds = list(zip(bounds[:-1], bounds[1:]))
+
+        direction = next_direction(fleet)
+        ghosts = px, np.rint(fleet.y[:n]), direction, fleet.broken[:n].copy()
+        owners = self.owner(px)
+        records = fleet.take(range(n))
+        self.conns = []
+        self.processes = []
+        for k, (x0, x1) in enumerate(self.bounds):
+            conn, child = Pipe()
+            process = Process(target=serve, daemon=True, args=(
+                child, world.map.map_file, world.classifier_options,
+                world.channel.broadcast_radius, world.tick, x0, x1,
+                [record for record, owner in zip(records, owners) if owner == k]))
+            process.start()
+            self.conns.append(conn)
+            self.processes.append(process)
+        self.arrivals = [[] for _ in self.bounds]
+        self.ghosts = self.route_ghosts([ghosts])
+
+    def owner(self, px):
+        return np.searchsorted(self.edges, px, side='right')
+
+    def call(self, requests):
+        for conn, request in zip(self.conns, requests):
+            conn.send(request)
+        replies = []
+        for k, conn in enumerate(self.conns):
+            ok, reply = conn.recv()
+            if not ok:
+                raise Exception(f'Region {k} failed: {reply}')
+            replies.append(reply)
+        return replies
+
+    # each region gets the vehicles in reach of it that another region owns
+    def route_ghosts(self, ghosts):
+        px, py, direction, broken = (np.concatenate(column) for column in zip(*ghosts))
+        owners = self.owner(px)
+        routed = []
+        for k, (x0, x1) in enumerate(self.bounds):
+            near = (px >= x0 - AHEAD_RADIUS) & (px < x1 + AHEAD_RADIUS) & (owners != k)
+            routed.append((px[near], py[near], direction[near], broken[near]))
+        return routed
+
+    # returns the broadcasts sent and messages received in the tick
+    def step(self):
+        sent = self.call([('advance', arrivals, ghosts)
+                          for arrivals, ghosts in zip(self.arrivals, self.ghosts)])
+        r = self.world.channel.broadcast_radius
+        remote = []
+        for k, (x0, x1) in enumerate(self.bounds):
+            remote.append([message for j, messages in enumerate(sent) if j != k
+                           for message in messages if x0 - r <= message[1].x < x1 + r])
+        settled = self.call([('settle', messages) for messages in remote])
+
+        self.arrivals = [[] for _ in self.bounds]
+        for departures, _, _ in settled:
+            for record in departures:
+                x = np.rint(record[1]['x'])
+                self.arrivals[int(self.owner(x))].append(record)
+        self.ghosts = self.route_ghosts([ghosts for _, ghosts, _ in settled])
+        self.world.tick += 1
+        return (sum(counts[0] for _, _, counts in settled),
+                sum(counts[1] for _, _, counts in settled))
+
+    # stops the workers and puts every vehicle back into the World, in id
+    # order as they were spawned
+    def close(self):
+        if not self.conns:
+            return
+        try:
+            records = [record for region in self.call([('collect',)] * len(self.conns))
+                       for record in region]
+            records += [record for arrivals in self.arrivals for record in arrivals]
+            self.world.fleet.adopt(sorted(records, key=lambda record: record[0]['id']))
+        finally:
+            for conn, process in zip(self.conns, self.processes):
+                conn.send(('stop',))
+                process.join()
+            self.conns = []
+
+
+# ids keep counting up across Worlds, so vehicles are compared in spawn order
+def vehicle_state(world):
+    return [(v.position, v.speed, v.acceleration, v.direction, v.parked,
+             v.inbox_size(), v.outbox_size()) for v in world.vehicles]
+
+
+# Steps the same seeded World in one process and across regions, parking
+# every fifth vehicle halfway so the run covers parked vehicles and the
+# weather broadcast at tick 1000, and checks both end in the same state.
+def check(map_file='maps/map0_.jpg', n_vehicles=300, workers=3, ticks=1010, seed=0):
+    from .runner import seed_all
+    states = []
+    for regions in [0, workers]:
+        seed_all(seed)
+        world = World(map_file, n_vehicles, engine='vector')
+        for _ in range(ticks // 2):
+            world.step()
+        for vehicle in world.vehicles[::5]:
+            vehicle.break_down()
+        domains = Domains(world, regions) if regions else None
+        try:
+            for _ in range(ticks - ticks // 2):
+                domains.step() if domains else world.step()
+        finally:
+            if domains:
+                domains.close()
+        states.append(vehicle_state(world))
+    if states[0] != states[1]:
+        diff = sum(a != b for a, b in zip(*states))
+        raise Exception(f'{diff} of {n_vehicles} vehicles differ after {ticks} ticks '
+                        f'across {workers} regions')
+    print(f'{n_vehicles} vehicles in {workers} regions match one process after {ticks} ticks')
+
+
+if __name__ == '__main__':
+    # python -m trafficsim.domain [map] [vehicles] [workers]
+    check(*sys.argv[1:2], *map(int, sys.argv[2:4]))
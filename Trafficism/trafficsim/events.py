@@ -0,0 +1,103 @@
+import json
+from collections import deque, namedtuple
+from threading import Event, Thread
+
+LogEvent = namedtuple(
+    'LogEvent', ['event', 'tick', 'vehicle', 'source', 'data', 'priority', 'rebroadcast'])
+
+
+def format_text(e):
+    if e.event == 'broadcast':
+        return f'Vehicle {e.vehicle} broadcasted {e.data} with priority {e.priority}\n'
+    if e.event == 'received':
+        return f'Vehicle {e.vehicle} received {e.data} from vehicle {e.source} {"Rebroadcasting" if e.rebroadcast else ""}\n'
+    if e.event == 'dropped':
+        return f'Vehicle {e.vehicle} dropped {e.data} from vehicle {e.source}\n'
+    return f'Vehicle {e.vehicle} discarded {e.data} from vehicle {e.source}\n'
+
+
+def format_jsonl(e):
+    return json.dumps(e._asdict(), separators=(',', ':')) + '\n'
+
+
+FORMATS = {
+    'text': format_text,
+    'jsonl': format_jsonl,
+}
+
+
+# Message events are appended to an in-memory ring buffer on the simulation
+# thread and formatted and written in batches by a background thread. If the
+# writer falls behind by more than `capacity` events the oldest are dropped.
+class EventLog:
+
+    def __init__(self, path='log.txt', fmt='text', capacity=1 << 16, batch=4096, interval=0.5):
+        self.path = path
+        self.format = FORMATS[fmt]
+        self.capacity = capacity
+        self.batch = batch
+        self.interval = interval
+        self.buffer = deque(maxlen=capacity)
+        self.dropped = 0
+        self.written = 0
+        self.file = open(path, 'w')
+        self.wake = Event()
+        self.closed = False
+        self.thread = Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+    def emit(self, event, tick, vehicle, source, data, priority, rebroadcast=False):
+        if len(self.buffer) == self.capacity:
+            self.dropped += 1
+        self.buffer.append(LogEvent(event, tick, vehicle,
+                           source, data, priority, rebroadcast))
+        if len(self.buffer) >= self.batch:
+            self.wake.set()
+
+    def flush(self):
+        lines = []
+        while self.buffer:
+            lines.append(self.format(self.buffer.popleft()))
+        if lines:
+            self.file.write(''.join(lines))
+            self.file.flush()
+            self.written += len(lines)
+
+    def writer(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+        if self.dropped:
+            print(f'Warning: {self.dropped} events were dropped from {self.path}, '
+                  f'the writer fell more than {self.capacity} behind')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# stands in for EventLog when logging is disabled
+class NullLog:
+    dropped = 0
+    written = 0
+
+    def emit(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
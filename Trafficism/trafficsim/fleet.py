@@ -0,0 +1,358 @@
+import math
+from collections import deque
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from . import Vehicle, Position
+
+
+def angle_limit(angle):
+    angle = np.where(angle > math.pi, angle - 2 * math.pi, angle)
+    return np.where(angle < -2 * math.pi, angle + 2 * math.pi, angle)
+
+
+def push(history, values):
+    history[:, :-1] = history[:, 1:]
+    history[:, -1] = values
+
+
+# per-vehicle state kept in the fleet arrays, with the dtype of each column
+FIELDS = {
+    'x': float,
+    'y': float,
+    'speed': float,
+    'acceleration': float,
+    'direction': float,
+    'steer': float,
+    'prev_direction': float,
+    'prev_sensor': float,
+    'road_type': bool,
+    'broken': bool,
+    'override_acceleration': bool,
+    'override_speed': bool,
+    'slowing_down': bool,
+    'parked': bool,
+    'MAX_SPEED': float,
+    'MAX_SPEED_BAD': float,
+    'MIN_SPEED': float,
+    'MAX_ACCEL': float,
+    'MIN_ACCEL': float,
+    'MAX_STEER': float,
+}
+# Vehicle.past: acceleration, road type, sensor, speed
+HISTORIES = ['past_acceleration', 'past_road', 'past_sensor', 'past_speed']
+LIMITS = ['MAX_SPEED', 'MAX_SPEED_BAD', 'MIN_SPEED',
+          'MAX_ACCEL', 'MIN_ACCEL', 'MAX_STEER']
+
+
+def _field(name, cast):
+    def fget(self):
+        return cast(getattr(self.fleet, name)[self.index])
+
+    def fset(self, value):
+        getattr(self.fleet, name)[self.index] = value
+    return property(fget, fset)
+
+
+# Vehicle whose kinematic state lives in the arrays of a Fleet
+class FleetVehicle(Vehicle):
+
+    def __init__(self, x, y, world, fleet, index, direction=None):
+        self.fleet = fleet
+        self.index = index
+        super().__init__(x, y, world, direction)
+
+    @property
+    def _position(self):
+        return Position(float(self.fleet.x[self.index]), float(self.fleet.y[self.index]))
+
+    @_position.setter
+    def _position(self, value):
+        self.fleet.x[self.index], self.fleet.y[self.index] = value
+
+    @property
+    def past(self):
+        return [deque(getattr(self.fleet, name)[self.index].tolist(), 5)
+                for name in HISTORIES]
+
+    @past.setter
+    def past(self, value):
+        for name, history in zip(HISTORIES, value):
+            getattr(self.fleet, name)[self.index] = list(history)
+
+    _speed = _field('speed', float)
+    _acceleration = _field('acceleration', float)
+    _direction = _field('direction', float)
+    _steer = _field('steer', float)
+
+
+for _name in ['prev_direction', 'prev_sensor'] + LIMITS:
+    setattr(FleetVehicle, _name, _field(_name, float))
+for _name in ['road_type', 'broken', 'override_acceleration', 'override_speed', 'slowing_down',
+              'parked']:
+    setattr(FleetVehicle, _name, _field(_name, bool))
+
+
+# Structure-of-arrays vehicle state advanced with vectorized operations.
+# Unlike the object engine every vehicle moves from the state at the start
+# of the tick, so the update order within a tick does not matter.
+class Fleet:
+    # (x, y, direction, broken) arrays of vehicles of other regions that can
+    # be ahead of this fleet's, see domain.py
+    ghosts = None
+
+    def __init__(self, world, capacity=64):
+        self.world = world
+        self.map = world.map
+        self.vehicles = world.vehicles
+        self.n = 0
+        self.tree = None
+        for name, dtype in FIELDS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        for name in HISTORIES:
+            setattr(self, name, np.zeros((capacity, 5)))
+
+        r = 2 * Vehicle.ROAD_WIDTH
+        theta1 = math.atan2(Vehicle.ROAD_WIDTH / 2, r)
+        theta2 = math.atan2(Vehicle.ROAD_WIDTH / 4, r)
+        l1 = math.sqrt(r ** 2 + (Vehicle.ROAD_WIDTH / 2) ** 2)
+        l2 = math.sqrt(r ** 2 + (Vehicle.ROAD_WIDTH / 4) ** 2)
+        self.sensor_angles = np.array([-theta1, -theta2, 0, theta2, theta1])
+        self.sensor_lengths = np.array([l1, l2, r, l2, l1])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['tree'] = None
+        return state
+
+    def grow(self):
+        capacity = 2 * len(self.x)
+        for name in list(FIELDS) + HISTORIES:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def spawn(self, x, y, direction=None):
+        if self.n == len(self.x):
+            self.grow()
+        index = self.n
+        self.n += 1
+        for name in LIMITS:
+            getattr(self, name)[index] = getattr(Vehicle, name)
+        return FleetVehicle(x, y, self.world, self, index, direction)
+
+    # Removes the vehicles at these indices and returns them as records
+    # that adopt can add to another fleet, with their message queues.
+    def take(self, indices):
+        indices = set(indices)
+        records = []
+        for i in sorted(indices):
+            vehicle = self.vehicles[i]
+            attrs = {name: value for name, value in vehicle.__dict__.items()
+                     if name not in ('fleet', 'index', 'world', 'map', 'comm')}
+            row = {name: getattr(self, name)[i].copy() for name in list(FIELDS) + HISTORIES}
+            records.append((attrs, row))
+            self.world.receiving.pop(vehicle.id, None)
+            self.world.sending.pop(vehicle.id, None)
+        keep = [i for i in range(self.n) if i not in indices]
+        for name in list(FIELDS) + HISTORIES:
+            array = getattr(self, name)
+            array[:len(keep)] = array[keep]
+        # world.vehicles is this list, so it is changed in place
+        self.vehicles[:] = [self.vehicles[i] for i in keep]
+        for index, vehicle in enumerate(self.vehicles):
+            vehicle.index = index
+        self.n = len(keep)
+        self.tree = None
+        return records
+
+    def adopt(self, records):
+        for attrs, row in records:
+            if self.n == len(self.x):
+                self.grow()
+            index = self.n
+            self.n += 1
+            for name, value in row.items():
+                getattr(self, name)[index] = value
+            vehicle = FleetVehicle.__new__(FleetVehicle)
+            vehicle.__dict__.update(attrs)
+            vehicle.fleet, vehicle.index = self, index
+            vehicle.world, vehicle.map, vehicle.comm = self.world, self.map, self.world.channel
+            self.vehicles.append(vehicle)
+            # back in the active sets World.step keeps
+            if vehicle.inbox_size():
+                self.world.receiving[vehicle.id] = vehicle
+            if vehicle.outbox_size():
+                self.world.sending[vehicle.id] = vehicle
+            if vehicle.new_message is not None:
+                self.world.reading.append(vehicle)
+        self.tree = None
+
+    # spatial index over the rounded positions, rebuilt lazily once the
+    # vehicles have moved
+    def kdtree(self):
+        if self.tree is None:
+            n = self.n
+            self.tree = cKDTree(np.column_stack((np.rint(self.x[:n]), np.rint(self.y[:n]))))
+        return self.tree
+
+    def insert(self, vehicle):
+        self.tree = None
+
+    def move(self, vehicle):
+        self.tree = None
+
+    def near(self, position, r):
+        return [self.vehicles[i] for i in sorted(self.kdtree().query_ball_point(position, r))]
+
+    def vehicles_ahead(self, px, py, direction, r=25):
+        n = self.n
+        tree = self.kdtree()
+        broken = self.broken[:n]
+        if self.ghosts is not None:
+            gx, gy, gdirection, gbroken = self.ghosts
+            px, py = np.concatenate((px, gx)), np.concatenate((py, gy))
+            direction = np.concatenate((direction, gdirection))
+            broken = np.concatenate((broken, gbroken))
+            tree = cKDTree(np.column_stack((px, py)))
+        pairs = tree.query_pairs(r, output_type='ndarray')
+        a = np.concatenate((pairs[:, 0], pairs[:, 1]))
+        b = np.concatenate((pairs[:, 1], pairs[:, 0]))
+        x = px[b] - px[a]
+        y = py[b] - py[a]
+        ok = (x ** 2 + y ** 2 < r ** 2) & ~broken[b]
+        ok &= np.abs(angle_limit(direction[b] - direction[a])) < 1.8
+        ok &= np.abs(angle_limit(np.arctan2(y, x) - direction[a])) < 1.8
+        ahead = np.zeros(len(px), dtype=bool)
+        ahead[a[ok]] = True
+        return ahead[:n]
+
+    def sense(self, x, y, direction):
+        angles = direction[:, None] + self.sensor_angles
+        p = np.rint(x[:, None] + self.sensor_lengths * np.cos(angles)).astype(int)
+        q = np.rint(y[:, None] + self.sensor_lengths * np.sin(angles)).astype(int)
+        sensor = self.map.sensor[q, p]
+        left = sensor[:, :2].sum(axis=1)
+        right = sensor[:, 3:].sum(axis=1)
+        value = -(2 * sensor[:, 0] + sensor[:, 1]) / np.maximum(left, 1) + \
+            (sensor[:, 3] + 2 * sensor[:, 4]) / np.maximum(right, 1)
+        return value, sensor.sum(axis=1)
+
+    def step(self):
+        n = self.n
+        parked = self.parked[:n]
+        # parked vehicles are left out of advance and track_events
+        rows = np.flatnonzero(~parked) if parked.any() else slice(0, n)
+        self.advance(rows)
+        self.track_events(rows)
+        if parked.any() and self.world.tick % 1000 == 0:
+            # Vehicle.idle: parked vehicles still send the weather
+            for i in np.flatnonzero(parked):
+                self.vehicles[i].broadcast_message(0, 'Weather', 500)
+        sending = self.world.sending
+        for i in sorted(sending):
+            sending[i].broadcast()
+
+    # update_direction, update_acceleration, update_speed and update_position
+    # for the vehicles at rows, a slice or an index array
+    def advance(self, rows):
+        n = self.n
+        x, y = self.x[rows], self.y[rows]
+        speed = self.speed[rows]
+        acceleration = self.acceleration[rows]
+
+        # update_direction
+        self.prev_direction[rows] = self.direction[rows]
+        prev_direction = self.prev_direction[rows]
+        direction = angle_limit(prev_direction + self.steer[rows])
+        self.direction[rows] = direction
+
+        # update_acceleration
+        px = np.rint(self.x[:n]).astype(int)
+        py = np.rint(self.y[:n]).astype(int)
+        ahead = self.vehicles_ahead(px, py, self.direction[:n])[rows]
+        px, py = px[rows], py[rows]
+        brake = (speed == self.MAX_SPEED[rows]) | ahead
+        straight = np.abs(angle_limit(prev_direction - direction)) < 0.07
+        free = ~self.override_acceleration[rows]
+        new = np.where(brake, acceleration - 0.01,
+                       np.where(straight, acceleration + Vehicle.DELTA_ACCEL,
+                                acceleration - Vehicle.DELTA_DECEL))
+        new = np.minimum(np.maximum(new, self.MIN_ACCEL[rows]), self.MAX_ACCEL[rows])
+        acceleration = np.where(free, new, acceleration)
+        self.acceleration[rows] = acceleration
+        self.slowing_down[rows] &= ~(free & ~brake & straight)
+
+        # update_speed
+        free = ~self.override_speed[rows]
+        limit = np.where(self.road_type[rows], self.MAX_SPEED_BAD[rows], self.MAX_SPEED[rows])
+        new = np.minimum(np.maximum(speed + acceleration * Vehicle.DELTA_TIME,
+                                    self.MIN_SPEED[rows]), limit)
+        speed = np.where(free, new, speed)
+        self.speed[rows] = speed
+
+        # update_position
+        self.road_type[rows] = self.map.bad[py, px]
+        dx = speed * np.cos(direction)
+        dy = speed * np.sin(direction)
+        p = px + np.rint(dx).astype(int)
+        q = py + np.rint(dy).astype(int)
+        off_road = ~self.map.road[q, p]
+        p, q = self.map.nearest_road(p[off_road], q[off_road])
+        dx[off_road] = p - px[off_road]
+        dy[off_road] = q - py[off_road]
+        self.x[rows] = x + dx
+        self.y[rows] = y + dy
+        self.tree = None
+
+    def track_events(self, rows):
+        x, y = self.x[rows], self.y[rows]
+        direction = self.direction[rows]
+        road_type = self.road_type[rows]
+
+        sensor_value, s = self.sense(x, y, direction)
+        past_sensor = self.past_sensor[rows]
+        road_closed = (s == 0) & (past_sensor.sum(axis=1) < 2)
+        direction[road_closed] = angle_limit(direction[road_closed] + math.pi)
+        self.direction[rows] = direction
+        push(past_sensor, s)
+        self.past_sensor[rows] = past_sensor
+        new = sensor_value * 0.2 + self.prev_sensor[rows] * 0.01
+        max_steer = self.MAX_STEER[rows]
+        self.steer[rows] = np.maximum(np.minimum(new, max_steer), -max_steer)
+        self.prev_sensor[rows] = sensor_value
+
+        past_acceleration = self.past_acceleration[rows]
+        push(past_acceleration, self.acceleration[rows])
+        self.past_acceleration[rows] = past_acceleration
+        past_speed = self.past_speed[rows]
+        push(past_speed, self.speed[rows])
+        self.past_speed[rows] = past_speed
+        slowing_down = self.slowing_down[rows]
+        slow_down = ~slowing_down & \
+            (past_speed[:, :4].min(axis=1) > past_speed[:, -1]) & \
+            (past_speed[:, -1] == self.MAX_SPEED_BAD[rows])
+        self.slowing_down[rows] = slowing_down | slow_down
+
+        past_road = self.past_road[rows]
+        push(past_road, road_type)
+        self.past_road[rows] = past_road
+        bad_road = road_type & (past_road.sum(axis=1) == 1)
+
+        indices = np.arange(self.n)[rows]
+        if self.world.tick % 1000 == 0:
+            events = np.arange(len(indices))
+        else:
+            events = np.flatnonzero(road_closed | slow_down | bad_road)
+        for k in events:
+            vehicle = self.vehicles[indices[k]]
+            if road_closed[k]:
+                vehicle.broadcast_message(2, 'Road Closed', 100)
+            if slow_down[k]:
+                vehicle.broadcast_message(3, 'Slow Down', 60)
+            if bad_road[k]:
+                vehicle.broadcast_message(1, 'Bad Road', 150)
+            if self.world.tick % 1000 == 0:
+                vehicle.broadcast_message(0, 'Weather', 500)
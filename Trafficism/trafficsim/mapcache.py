@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from . import MAP_CACHE_DIR as CACHE_DIR
+from .model_cache import file_hash
+
+VERSION = 1
+# the Map attributes stored in a compiled map, one .npy file each
+LAYERS = ['map', 'road', 'bad', 'sensor', 'nearest',
+          'valid_points', 'spawn_x', 'spawn_y']
+
+
+def artifact_path(map_file, cache_dir=CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(map_file))[0]
+    return os.path.join(cache_dir, f'{stem}-{file_hash(map_file)[:16]}-v{VERSION}')
+
+
+# Builds the map from its image and writes every layer and its metadata to a
+# directory named after the hash of the image, so editing the image compiles
+# it again. Workers racing to compile the same map each write their own
+# directory and only the first rename wins.
+def compile_map(map_file, cache_dir=CACHE_DIR):
+    from . import Map, ROAD_TYPES
+    path = artifact_path(map_file, cache_dir)
+    if os.path.exists(path):
+        return path
+
+    built = Map(map_file, cache_dir=None)
+    built.spawn_table()
+    layers = {
+        'map': built.map,
+        'road': built.road,
+        'bad': built.bad,
+        'sensor': built.sensor,
+        'nearest': built.nearest.astype(np.int32),
+        'valid_points': np.array(built.valid_points, dtype=np.int32).reshape(-1, 2),
+        'spawn_x': built.spawns[0].astype(np.int32),
+        'spawn_y': built.spawns[1].astype(np.int32),
+    }
+    tmp = f'{path}.{os.getpid()}.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    for name, layer in layers.items():
+        np.save(os.path.join(tmp, name + '.npy'), layer)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({
+            'source': map_file,
+            'hash': file_hash(map_file),
+            'version': VERSION,
+            'height': built.height,
+            'width': built.width,
+            'road_types': ROAD_TYPES,
+            'valid_points': len(layers['valid_points']),
+            'spawns': len(layers['spawn_x']),
+        }, f, indent=2)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp)
+    return path
+
+
+# the layers of a compiled map, memory-mapped read-only so that every process
+# loading the same map shares one copy of its pages
+def load_map(map_file, cache_dir=CACHE_DIR):
+    path = compile_map(map_file, cache_dir)
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+            for name in LAYERS}
+
+
+if __name__ == '__main__':
+    # python -m trafficsim.mapcache maps/*
+    for map_file in sys.argv[1:]:
+        print(f'{map_file} -> {compile_map(map_file)}')
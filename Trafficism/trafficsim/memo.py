@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# priority, acceleration, speed, direction, is_ahead, same_heading, dist
+RESOLUTION = (1, 0.01, 0.05, 0.05, 1, 1, 5)
+
+
+# Memoizes the decisions of a classifier in a bounded LRU keyed by the
+# features quantized to `resolution`. A miss classifies the centre of the
+# feature's bucket, so a decision only depends on its key and never on which
+# row of the bucket happened to be seen first.
+class MemoClassifier:
+
+    def __init__(self, classify, resolution=RESOLUTION, maxsize=1 << 16):
+        self.classify = classify
+        self.resolution = np.broadcast_to(
+            np.asarray(resolution, dtype=float), (7,)).copy()
+        self.maxsize = maxsize
+        self.decisions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.decisions)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self)}
+
+    def predict(self, data):
+        return self.predict_batch([data])[0]
+
+    def predict_batch(self, data):
+        keys = np.rint(np.asarray(data, dtype=float).reshape(-1, 7) /
+                       self.resolution).astype(np.int64)
+        decisions = np.zeros((len(keys), 2), dtype=bool)
+        missing = {}
+        for i, key in enumerate(map(tuple, keys.tolist())):
+            decision = self.decisions.get(key)
+            if decision is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                self.decisions.move_to_end(key)
+                decisions[i] = decision
+                self.hits += 1
+
+        if missing:
+            # repeated keys within the batch are hits after the first row
+            self.misses += len(missing)
+            self.hits += sum(map(len, missing.values())) - len(missing)
+            centres = np.array(list(missing), dtype=float) * self.resolution
+            for (key, rows), decision in zip(missing.items(), self.classify(centres)):
+                decision = (bool(decision[0]), bool(decision[1]))
+                decisions[rows] = decision
+                self.decisions[key] = decision
+            while len(self.decisions) > self.maxsize:
+                self.decisions.popitem(last=False)
+                self.evictions += 1
+        return decisions
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+import pickle
+
+CACHE_DIR = 'trafficsim/models'
+
+
+def file_hash(*paths):
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(name, params, data_files):
+    import sklearn
+    key = json.dumps({
+        'name': name,
+        'params': params,
+        'data': file_hash(*data_files),
+        'sklearn': sklearn.__version__,
+    }, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+# Returns fit() from the cache when a model with the same name and params was
+# fitted on identical data files, otherwise calls it and stores the result.
+def cached(name, params, fit, data_files=('data.csv',), retrain=False, cache_dir=CACHE_DIR):
+    path = os.path.join(
+        cache_dir, f'{name}-{cache_key(name, params, data_files)}.pkl')
+    if not retrain and os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f), True
+
+    artifact = fit()
+    os.makedirs(cache_dir, exist_ok=True)
+    # each process writes its own file, the last replace wins
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(artifact, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return artifact, False
@@ -0,0 +1,156 @@
+from collections import Counter
+from time import perf_counter
+
+from . import Vehicle
+
+
+# Times the phases of World.step and World.render by swapping timing
+# wrappers in for the methods that implement them. Disabling puts the
+# original methods back, so a disabled profiler costs nothing.
+#
+# Vehicle methods are shared by every world, so their wrappers are too: they
+# are put in by the first profiler enabled and taken out by the last one
+# disabled, and time each call for the profiler of the vehicle's own world.
+class Profiler:
+    # (class, attribute) -> [original, whether the class defined it, number
+    # of enabled profilers using the wrapper]
+    shared = {}
+
+    def __init__(self, world):
+        self.world = world
+        self.enabled = False
+        self.patched = []
+        self.sharing = []
+        self.time = Counter()
+        self.calls = Counter()
+        self.messages = Counter()
+
+    # cleared in place, the wrappers hold on to the counters
+    def reset(self):
+        self.time.clear()
+        self.calls.clear()
+        self.messages.clear()
+
+    # (owner, attribute, phase) for every instrumented method; phases nest,
+    # e.g. classify runs inside read_message and sense inside event_tracker
+    def targets(self):
+        world = self.world
+        targets = [
+            (world, 'step', 'step'),
+            (world, 'read_messages', 'read_message'),
+            (world, 'classify', 'classify'),
+            (world, 'render', 'render'),
+            (Vehicle, 'broadcast', 'broadcast'),
+        ]
+        if world.fleet is None:
+            targets += [
+                (Vehicle, 'update_position', 'update_position'),
+                (Vehicle, 'event_tracker', 'event_tracker'),
+                (Vehicle, 'sense', 'sense'),
+            ]
+        else:
+            targets += [
+                (world.fleet, 'advance', 'update_position'),
+                (world.fleet, 'track_events', 'event_tracker'),
+                (world.fleet, 'sense', 'sense'),
+            ]
+        return targets
+
+    def timed(self, name, fn):
+        time, calls = self.time, self.calls
+
+        def wrapper(*args, **kwargs):
+            t = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                time[name] += perf_counter() - t
+                calls[name] += 1
+        return wrapper
+
+    @staticmethod
+    def dispatched(name, fn):
+        def wrapper(vehicle, *args, **kwargs):
+            profiler = getattr(vehicle.world, 'profiler', None)
+            if profiler is None or not profiler.enabled:
+                return fn(vehicle, *args, **kwargs)
+            t = perf_counter()
+            try:
+                return fn(vehicle, *args, **kwargs)
+            finally:
+                profiler.time[name] += perf_counter() - t
+                profiler.calls[name] += 1
+        return wrapper
+
+    def count(self, emit):
+        messages = self.messages
+
+        def wrapper(event, tick, vehicle, source, data, priority, rebroadcast=False):
+            messages[event] += 1
+            if rebroadcast:
+                messages['rebroadcast'] += 1
+            return emit(event, tick, vehicle, source, data, priority, rebroadcast)
+        return wrapper
+
+    def patch(self, owner, name, value):
+        # instance attributes are deleted again, class attributes restored
+        own = name in vars(owner)
+        self.patched.append((owner, name, vars(owner).get(name), own))
+        setattr(owner, name, value)
+
+    def share(self, owner, name, phase):
+        entry = Profiler.shared.get((owner, name))
+        if entry is None:
+            entry = Profiler.shared[owner, name] = [vars(owner).get(name), name in vars(owner), 0]
+            setattr(owner, name, self.dispatched(phase, getattr(owner, name)))
+        entry[2] += 1
+        self.sharing.append((owner, name))
+
+    def unshare(self, owner, name):
+        entry = Profiler.shared[owner, name]
+        entry[2] -= 1
+        if entry[2]:
+            return
+        del Profiler.shared[owner, name]
+        if entry[1]:
+            setattr(owner, name, entry[0])
+        else:
+            delattr(owner, name)
+
+    def enable(self):
+        if self.enabled:
+            return
+        for owner, name, phase in self.targets():
+            if isinstance(owner, type):
+                self.share(owner, name, phase)
+            else:
+                self.patch(owner, name, self.timed(phase, getattr(owner, name)))
+        self.patch(self.world.log, 'emit', self.count(self.world.log.emit))
+        self.enabled = True
+
+    def disable(self):
+        for owner, name, original, own in reversed(self.patched):
+            if own:
+                setattr(owner, name, original)
+            else:
+                delattr(owner, name)
+        for owner, name in self.sharing:
+            self.unshare(owner, name)
+        self.patched = []
+        self.sharing = []
+        self.enabled = False
+
+    def report(self):
+        lines = [f'{"phase":<16}{"calls":>10}{"total s":>12}{"mean us":>12}']
+        for phase, total in self.time.most_common():
+            # a call still running when this is read has its time but no count
+            calls = self.calls[phase]
+            mean = total / calls * 1e6 if calls else 0
+            lines.append(f'{phase:<16}{calls:>10}{total:>12.3f}{mean:>12.1f}')
+        m = self.messages
+        lines.append(f'messages: sent {m["broadcast"]}  received {m["received"]}  '
+                     f'discarded {m["discarded"]}  rebroadcast {m["rebroadcast"]}  '
+                     f'dropped {m["dropped"]}')
+        if not self.enabled:
+            lines.append('(profiling is off)')
+        return '\n'.join(lines)
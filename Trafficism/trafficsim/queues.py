@@ -0,0 +1,75 @@
+import heapq
+from collections import OrderedDict
+
+# which message a full queue gives up for a new one
+DROP_POLICIES = ['lowest', 'oldest', 'newest']
+
+
+# Priority queue of messages. pop returns the highest priority first and,
+# among equal priorities, the most recently pushed one. With a capacity, a
+# push onto a full queue drops a message according to `policy`:
+#   lowest - the lowest priority message, the oldest of those
+#   oldest - the message that has waited longest
+#   newest - the message being pushed
+class MessageQueue:
+
+    def __init__(self, capacity=None, policy='lowest'):
+        if policy not in DROP_POLICIES:
+            raise Exception(f'Unknown drop policy {policy}')
+        self.capacity = capacity
+        self.policy = policy
+        self.heap = []
+        self.pushed = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    # returns the message that was dropped to make room, if any
+    def push(self, message):
+        self.pushed += 1
+        entry = (-message.priority, -self.pushed, message)
+        if self.capacity is None or len(self.heap) < self.capacity:
+            heapq.heappush(self.heap, entry)
+            return None
+
+        self.dropped += 1
+        if self.policy == 'newest' or not self.heap:
+            return message
+        if self.policy == 'lowest':
+            worst = max(range(len(self.heap)), key=lambda i: self.heap[i][:2])
+            if entry[:2] > self.heap[worst][:2]:
+                return message
+        else:
+            worst = max(range(len(self.heap)), key=lambda i: self.heap[i][1])
+        dropped = self.heap[worst][2]
+        self.heap[worst] = entry
+        heapq.heapify(self.heap)
+        return dropped
+
+    def pop(self):
+        return heapq.heappop(self.heap)[2] if self.heap else None
+
+
+# Keys seen within the last `ttl` ticks. Keys are kept in the order they were
+# added, which is also the order they expire in, so expiry is amortized O(1).
+class RecentSet:
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.ticks = OrderedDict()
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def expire(self, tick):
+        while self.ticks and tick - next(iter(self.ticks.values())) >= self.ttl:
+            self.ticks.popitem(last=False)
+
+    # records the key and returns True, or False if it was already seen
+    def add(self, key, tick):
+        self.expire(tick)
+        if key in self.ticks:
+            return False
+        self.ticks[key] = tick
+        return True
@@ -1,11 +1,81 @@
+import os
+
 from sklearn.model_selection import train_test_split
+import numpy as np
 import pandas as pd
 
+# header of the binary datasets: magic, version, rows, train rows, features, labels
+HEADER = np.dtype([('magic', 'S4'), ('version', '<u4'), ('rows', '<u8'), ('train', '<u8'),
+                   ('features', '<u4'), ('labels', '<u4')])
+HEADER_SIZE = 64
+MAGIC = b'TSDS'
+VERSION = 1
+
 
-def read_data():
-    dataset = pd.read_csv("data.csv")
+# path is data.csv or the manifest.json of shards written by generate.py
+def read_data(path='data.csv'):
+    if path.endswith('.json'):
+        from .datagen import load_dataset
+        dataset = load_dataset(path)
+    else:
+        dataset = pd.read_csv(path)
 
     predictors = dataset.drop(["useful", "rebroadcast"], axis=1)
     target = dataset[["useful", "rebroadcast"]]
 
     return train_test_split(predictors, target, test_size=0.20, random_state=0)
+
+
+# the files a model trained on `path` depends on, for the model cache
+def data_files(path='data.csv'):
+    if path.endswith('.json'):
+        from .datagen import shard_files
+        return (path,) + tuple(shard_files(path))
+    return (path,)
+
+
+def binary_path(path):
+    return os.path.splitext(path)[0] + '.bin'
+
+
+# Writes the dataset at `path` as a float32 feature matrix followed by a bool
+# label matrix. The rows are stored training split first, in the order
+# read_data's split would give them, so both splits are plain slices.
+def convert(path='data.csv', out=None):
+    out = out or binary_path(path)
+    x_train, x_test, y_train, y_test = read_data(path)
+    features = np.concatenate((x_train, x_test)).astype(np.float32)
+    labels = np.concatenate((y_train, y_test)).astype(bool)
+
+    header = np.zeros(1, HEADER)
+    header[0] = (MAGIC, VERSION, len(features), len(x_train), features.shape[1], labels.shape[1])
+    tmp = f'{out}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        f.write(features.tobytes())
+        f.write(labels.tobytes())
+    os.replace(tmp, out)
+    return out
+
+
+# read-only memory maps of the features and labels and the number of training
+# rows; the pages are shared by every process that opens the same file
+def open_binary(path):
+    header = np.fromfile(path, HEADER, count=1)[0]
+    if header['magic'] != MAGIC or header['version'] != VERSION:
+        raise Exception(f'{path} is not a version {VERSION} dataset')
+    rows, n_features, n_labels = int(header['rows']), int(header['features']), int(header['labels'])
+    features = np.memmap(path, np.float32, 'r', HEADER_SIZE, (rows, n_features))
+    labels = np.memmap(path, bool, 'r', HEADER_SIZE + features.nbytes, (rows, n_labels))
+    return features, labels, int(header['train'])
+
+
+# read_data as arrays: x_train, x_test, y_train, y_test are views of a memory
+# mapped binary copy of `path`, converted again whenever the source is newer
+def read_arrays(path='data.csv'):
+    out = binary_path(path)
+    if not os.path.exists(out) or \
+            os.path.getmtime(out) < max(map(os.path.getmtime, data_files(path))):
+        convert(path, out)
+    features, labels, train = open_binary(out)
+    return features[:train], features[train:], labels[:train], labels[train:]
@@ -0,0 +1,99 @@
+import math
+
+import cv2
+import numpy as np
+
+
+# Draws the vehicles over a static copy of the map. Only the regions drawn
+# on in the previous frame are restored from the background, unless they
+# cover more than the whole frame, in which case it is copied in one go.
+# Frames can go to a window, a video file or both, every `every` ticks.
+class Renderer:
+
+    def __init__(self, world, every=1, show=True, video=None, fps=30, fourcc='mp4v'):
+        self.world = world
+        self.every = every
+        self.show = show
+        if not isinstance(world.map.map, np.ndarray):
+            raise Exception('Rendering needs a map held in memory, not a tiled one')
+        self.background = world.map.map
+        self.frame = self.background.copy()
+        self.height, self.width = self.frame.shape[:2]
+        self.dirty = []
+        self.frames = 0
+        self.writer = None
+        if video is not None:
+            self.writer = cv2.VideoWriter(
+                video, cv2.VideoWriter_fourcc(*fourcc), fps, (self.width, self.height))
+
+    def clip(self, x, y, r):
+        return max(x - r, 0), max(y - r, 0), min(x + r + 1, self.width), min(y + r + 1, self.height)
+
+    def restore(self):
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in self.dirty)
+        if area >= self.width * self.height:
+            np.copyto(self.frame, self.background)
+        else:
+            for x0, y0, x1, y1 in self.dirty:
+                self.frame[y0:y1, x0:x1] = self.background[y0:y1, x0:x1]
+        self.dirty = []
+
+    def draw(self):
+        self.restore()
+        world = self.world
+        frame = self.frame
+        broadcasting = set(map(id, world.render_broadcast))
+        received = {}
+        for veh_id, veh in world.render_receive:
+            received.setdefault(id(veh), veh_id)
+        colors = {v.id: v.color for v in world.vehicles}
+        radius = world.channel.broadcast_radius
+
+        for vehicle in world.vehicles:
+            x, y = position = tuple(vehicle.position)
+            tip = (round(x + 20 * math.cos(vehicle.direction)),
+                   round(y + 20 * math.sin(vehicle.direction)))
+            cv2.arrowedLine(frame, position, tip, vehicle.color, 10)
+            cv2.circle(frame, position, 3, (0, 0, 0), -1)
+            self.dirty.append(self.clip(x, y, 28))
+            if id(vehicle) in broadcasting:
+                cv2.circle(frame, position, radius, vehicle.color, 2)
+                self.dirty.append(self.clip(x, y, radius + 2))
+            if id(vehicle) in received:
+                cv2.circle(frame, position, 8, colors[received[id(vehicle)]], -1)
+        return frame
+
+    # force: draw even if this is not one of every `every` ticks
+    def render(self, force=False):
+        if self.world.tick % self.every and not force:
+            return
+        frame = self.draw()
+        self.frames += 1
+        if self.writer is not None:
+            self.writer.write(frame)
+        if self.show:
+            cv2.imshow(self.world.map.map_file, frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+# One swatch per vehicle in a grid at most `columns` wide and `rows` high.
+# Vehicles beyond that are left out rather than growing the image.
+def legend(vehicles, size=50, columns=20, rows=10):
+    shown = vehicles[:columns * rows]
+    n_columns = min(len(shown), columns) or 1
+    n_rows = math.ceil(len(shown) / n_columns) or 1
+    image = np.full((size * n_rows, size * n_columns, 3), 255, dtype=np.uint8)
+    for i, vehicle in enumerate(shown):
+        row, column = divmod(i, n_columns)
+        center = (size * column + size // 2, size * row + size // 2)
+        cv2.circle(image, center, size * 2 // 5, vehicle.color, -1)
+        cv2.putText(image, str(vehicle.id), (center[0] - size // 4, center[1] + size // 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, size / 150, (0, 0, 0), 1)
+    if len(vehicles) > len(shown):
+        cv2.putText(image, f'+{len(vehicles) - len(shown)} more', (5, image.shape[0] - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    return image
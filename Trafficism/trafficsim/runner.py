@@ -0,0 +1,110 @@
+import random
+from time import perf_counter
+
+import numpy as np
+
+from . import World, Vehicle, EventLog
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    # MAX_SPEED is drawn from random when the module is imported
+    Vehicle.MAX_SPEED = max(random.random() * 2, 1)
+
+
+def run(map_file, n_vehicles, classifier=None, seed=None, ticks=1000, engine='object',
+        log_file=None, log_format='jsonl', retrain=False, cache_size=0, profile=False,
+        video=None, render_every=1, fps=30, restore=None, snapshot=None, spacing=0,
+        serve=None, workers=0):
+    if seed is not None and restore is None:
+        seed_all(seed)
+
+    t = perf_counter()
+    log = None if log_file is None else EventLog(log_file, log_format)
+    cache = {'maxsize': cache_size} if cache_size else None
+    if restore is None:
+        world = World(map_file, n_vehicles, classifier, engine, log, retrain, cache, profile,
+                      spacing)
+    else:
+        # map, fleet, classifier and engine all come from the snapshot
+        world = World.load(restore, log)
+        map_file, n_vehicles = world.map.map_file, len(world.vehicles)
+        classifier = world.classifier_options[0]
+        engine = 'object' if world.fleet is None else 'vector'
+        if profile:
+            world.profiler.enable()
+    renderer = None
+    if video is not None:
+        renderer = world.start_renderer(render_every, video, fps, show=False)
+    controller = server = None
+    if serve is not None:
+        from .control import Controller, Server
+        controller = Controller(world)
+        server = Server(controller, port=serve)
+        print(f'Serving commands on {server.host}:{server.start()}')
+    domains = None
+    if workers > 1:
+        if engine != 'vector' or log is not None or video is not None or serve is not None or profile:
+            raise Exception('Regions need the vector engine and no log, video, commands or profile')
+        from .domain import Domains
+        domains = Domains(world, workers)
+    load_time = perf_counter() - t
+
+    broadcasts = 0
+    received = 0
+    t = perf_counter()
+    try:
+        for _ in range(ticks):
+            if domains is not None:
+                sent, read = domains.step()
+                broadcasts += sent
+                received += read
+                continue
+            if controller is not None:
+                controller.apply()
+            world.step()
+            if controller is not None:
+                controller.publish()
+            if renderer is not None:
+                renderer.render()
+            broadcasts += len(world.render_broadcast)
+            received += len(world.render_receive)
+        if domains is not None:
+            domains.close()
+        if snapshot is not None:
+            world.save(snapshot)
+    finally:
+        if domains is not None:
+            domains.close()
+        if server is not None:
+            server.stop()
+        world.close()
+    elapsed = perf_counter() - t
+
+    summary = {
+        'map': map_file,
+        'n_vehicles': n_vehicles,
+        'classifier': classifier or 'naive',
+        'seed': seed,
+        'engine': engine,
+        'ticks': ticks,
+        'tick': world.tick,
+        'load_time': load_time,
+        'elapsed': elapsed,
+        'ticks_per_s': ticks / elapsed if elapsed else float('inf'),
+        'broadcasts': broadcasts,
+        'received': received,
+        'broken': sum(v.broken for v in world.vehicles),
+        'mean_speed': sum(v.speed for v in world.vehicles) / max(len(world.vehicles), 1),
+        'log_written': world.log.written,
+        'log_dropped': world.log.dropped,
+    }
+    if profile:
+        summary['profile'] = world.profiler.report()
+    if renderer is not None:
+        summary['frames'] = renderer.frames
+    if world.cache is not None:
+        summary.update(
+            {f'cache_{k}': v for k, v in world.cache.stats().items()})
+    return summary
@@ -0,0 +1,51 @@
+import gzip
+import pickle
+import random
+
+import numpy as np
+
+from . import Vehicle
+
+VERSION = 2
+
+
+# Saves a World mid-run together with the process-wide state it depends on:
+# the random and np.random generators, the vehicle id counter and the
+# Vehicle.MAX_SPEED drawn at import. The map is reloaded from its file and the
+# classifier loaded again on restore, so the file only holds simulation state.
+def save(world, path):
+    enabled = world.profiler.enabled
+    # the profiler's wrappers cannot be pickled
+    world.profiler.disable()
+    try:
+        state = {
+            'version': VERSION,
+            'world': world,
+            'random': random.getstate(),
+            'np_random': np.random.get_state(),
+            'vehicle_id': Vehicle._Vehicle__ID,
+            'max_speed': Vehicle.MAX_SPEED,
+        }
+        with gzip.open(path, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        if enabled:
+            world.profiler.enable()
+
+
+# Restores the world and the global state, so that stepping it continues
+# exactly as the saved run would have. Loading the same file again gives an
+# independent copy, e.g. to branch what-if scenarios from one warm-up.
+def load(path, log=None):
+    with gzip.open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state['version'] != VERSION:
+        raise Exception(f'Unsupported snapshot version {state["version"]}')
+    random.setstate(state['random'])
+    np.random.set_state(state['np_random'])
+    Vehicle._Vehicle__ID = state['vehicle_id']
+    Vehicle.MAX_SPEED = state['max_speed']
+    world = state['world']
+    if log is not None:
+        world.log = log
+    return world
@@ -0,0 +1,50 @@
+from operator import attrgetter
+
+
+# Uniform grid over the map holding every vehicle in the cell of its current
+# (rounded) position. Vehicles are moved between cells as they are updated,
+# so queries always see the same positions as a full scan would.
+class SpatialGrid:
+
+    def __init__(self, cell_size=32):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.cell_of = {}
+
+    def cell(self, position):
+        return position.x // self.cell_size, position.y // self.cell_size
+
+    def insert(self, vehicle):
+        cell = self.cell(vehicle.position)
+        self.cells.setdefault(cell, {})[vehicle.id] = vehicle
+        self.cell_of[vehicle.id] = cell
+
+    def remove(self, vehicle):
+        cell = self.cell_of.pop(vehicle.id)
+        del self.cells[cell][vehicle.id]
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def move(self, vehicle):
+        if self.cell(vehicle.position) != self.cell_of[vehicle.id]:
+            self.remove(vehicle)
+            self.insert(vehicle)
+
+    def rebuild(self, vehicles):
+        self.cells = {}
+        self.cell_of = {}
+        for vehicle in vehicles:
+            self.insert(vehicle)
+
+    def near(self, position, r):
+        x0, y0 = (position.x - r) // self.cell_size, (position.y - r) // self.cell_size
+        x1, y1 = (position.x + r) // self.cell_size, (position.y + r) // self.cell_size
+        found = []
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                cell = self.cells.get((cx, cy))
+                if cell:
+                    found.extend(cell.values())
+        # same order as scanning World.vehicles
+        found.sort(key=attrgetter('id'))
+        return found
@@ -0,0 +1,233 @@
+import json
+import math
+import os
+import sys
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from . import Map, alignable
+
+TILES = 'tiles.json'
+
+
+# Decoded tiles of a tiled map directory, at most `maxsize` of them in memory.
+# Each tile holds its BGR pixels and the masks Map derives from them; tiles
+# missing from the directory are blank.
+class TileCache:
+
+    def __init__(self, root, meta, maxsize=64):
+        self.root = root
+        self.size = meta['tile_size']
+        self.pattern = meta['pattern']
+        self.rows = math.ceil(meta['height'] / self.size)
+        self.cols = math.ceil(meta['width'] / self.size)
+        self.maxsize = maxsize
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, row, col):
+        path = os.path.join(self.root, self.pattern.format(row=row, col=col))
+        image = cv2.imread(path) if os.path.exists(path) else None
+        if image is None:
+            image = np.full((self.size, self.size, 3), 255, dtype=np.uint8)
+        # the same masks as Map.build
+        return {
+            'map': image,
+            'road': np.any(image != 255, axis=-1),
+            'bad': (image[..., 0] == 0) & (image[..., 1] == 0) & (image[..., 2] >= 253),
+            'sensor': np.all(image != 255, axis=-1),
+            'valid': np.any(image == 0, axis=-1),
+        }
+
+    def get(self, row, col):
+        tile = self.tiles.get((row, col))
+        if tile is None:
+            self.misses += 1
+            tile = self.tiles[row, col] = self.load(row, col)
+            if len(self.tiles) > self.maxsize:
+                self.tiles.popitem(last=False)
+        else:
+            self.hits += 1
+            self.tiles.move_to_end((row, col))
+        return tile
+
+
+# One layer of a tiled map, indexed like the full array would be: layer[y, x]
+# with ints or integer arrays, and layer[y0:y1, x0:x1] windows.
+class TiledLayer:
+
+    def __init__(self, cache, name, height, width):
+        self.cache = cache
+        self.name = name
+        sample = cache.get(0, 0)[name]
+        self.dtype = sample.dtype
+        self.shape = (height, width) + sample.shape[2:]
+
+    def __getitem__(self, key):
+        y, x = key
+        if isinstance(y, slice):
+            return self.window(y, x)
+        if np.ndim(y) == 0 and np.ndim(x) == 0:
+            y, x = map(int, self.wrap(y, x))
+            size = self.cache.size
+            return self.cache.get(y // size, x // size)[self.name][y % size, x % size]
+        return self.gather(np.asarray(y), np.asarray(x))
+
+    # negative indices count from the end and others must be on the map, as
+    # with NumPy
+    def wrap(self, y, x):
+        height, width = self.shape[:2]
+        y = np.where(y < 0, y + height, y)
+        x = np.where(x < 0, x + width, x)
+        if np.any((y < 0) | (y >= height) | (x < 0) | (x >= width)):
+            raise IndexError(f'index out of bounds for a {height}x{width} map')
+        return y.astype(int), x.astype(int)
+
+    def gather(self, y, x):
+        y, x = np.broadcast_arrays(*self.wrap(y, x))
+        size = self.cache.size
+        out = np.empty(y.shape + self.shape[2:], dtype=self.dtype)
+        tiles = (y // size) * self.cache.cols + x // size
+        for tile in np.unique(tiles):
+            at = tiles == tile
+            layer = self.cache.get(*divmod(int(tile), self.cache.cols))[self.name]
+            out[at] = layer[y[at] % size, x[at] % size]
+        return out
+
+    def window(self, rows, cols):
+        height, width = self.shape[:2]
+        y0, y1, _ = rows.indices(height)
+        x0, x1, _ = cols.indices(width)
+        y1, x1 = max(y0, y1), max(x0, x1)
+        out = np.empty((y1 - y0, x1 - x0) + self.shape[2:], dtype=self.dtype)
+        size = self.cache.size
+        for row in range(y0 // size, (y1 - 1) // size + 1 if y1 > y0 else 0):
+            for col in range(x0 // size, (x1 - 1) // size + 1 if x1 > x0 else 0):
+                layer = self.cache.get(row, col)[self.name]
+                ty0, ty1 = max(y0, row * size), min(y1, (row + 1) * size)
+                tx0, tx1 = max(x0, col * size), min(x1, (col + 1) * size)
+                out[ty0 - y0:ty1 - y0, tx0 - x0:tx1 - x0] = \
+                    layer[ty0 - row * size:ty1 - row * size, tx0 - col * size:tx1 - col * size]
+        return out
+
+    # like window, but parts off the map are zero instead of wrapping around
+    def padded(self, y0, y1, x0, x1):
+        height, width = self.shape[:2]
+        out = np.zeros((y1 - y0, x1 - x0) + self.shape[2:], dtype=self.dtype)
+        cy0, cy1 = max(y0, 0), min(y1, height)
+        cx0, cx1 = max(x0, 0), min(x1, width)
+        if cy0 < cy1 and cx0 < cx1:
+            out[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = self.window(slice(cy0, cy1), slice(cx0, cx1))
+        return out
+
+
+# A Map read from a directory of fixed-size tiles (see split) instead of one
+# image. Tiles are decoded on demand and at most `max_tiles` kept, so the map
+# can be far larger than memory. The spawn table is built one tile at a time
+# and only the number of spawn points of each tile is kept.
+class TiledMap(Map):
+
+    def __init__(self, map_file, max_tiles=64, spawn_tiles=16):
+        self.map_file = map_file
+        with open(os.path.join(map_file, TILES)) as f:
+            meta = json.load(f)
+        self.height, self.width = meta['height'], meta['width']
+        self.tiles = TileCache(map_file, meta, max_tiles)
+        for name in ['map', 'road', 'bad', 'sensor']:
+            setattr(self, name, TiledLayer(self.tiles, name, self.height, self.width))
+        self.spawn_tiles = spawn_tiles
+        self.tile_spawns = OrderedDict()
+        self.counts = None
+
+    def __getstate__(self):
+        return {'map_file': self.map_file, 'max_tiles': self.tiles.maxsize,
+                'spawn_tiles': self.spawn_tiles}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    # the spawn table of one tile, as Map.spawn_table for its points
+    def tile_spawn_table(self, row, col, r=20):
+        table = self.tile_spawns.get((row, col))
+        if table is not None:
+            self.tile_spawns.move_to_end((row, col))
+            return table
+        size = self.tiles.size
+        y, x = np.nonzero(self.tiles.get(row, col)['valid'])
+        y0, x0 = row * size, col * size
+        keep = (y0 + y < self.height) & (x0 + x < self.width)
+        x, y = x[keep] + x0, y[keep] + y0
+        found = np.zeros(len(x), dtype=bool)
+        edge = (x < r) | (y < r)
+        for k in np.flatnonzero(edge):
+            found[k] = self.heading(x[k], y[k], r) is not None
+        road = self.road.padded(y0 - r, y0 + size + r, x0 - r, x0 + size + r)
+        found[~edge] = alignable(road, x[~edge] - x0, y[~edge] - y0, r)
+        table = self.tile_spawns[row, col] = x[found], y[found]
+        if len(self.tile_spawns) > self.spawn_tiles:
+            self.tile_spawns.popitem(last=False)
+        return table
+
+    def spawn_count(self):
+        if self.counts is None:
+            counts = [len(self.tile_spawn_table(row, col)[0])
+                      for row in range(self.tiles.rows) for col in range(self.tiles.cols)]
+            self.counts = np.cumsum(counts)
+        return int(self.counts[-1]) if len(self.counts) else 0
+
+    def spawn_point(self, i):
+        self.spawn_count()
+        tile = int(np.searchsorted(self.counts, i, side='right'))
+        i -= int(self.counts[tile - 1]) if tile else 0
+        x, y = self.tile_spawn_table(*divmod(tile, self.tiles.cols))
+        return int(x[i]), int(y[i])
+
+    # closest road pixel to each point, searched in a window that grows until
+    # it holds one no further away than the window's half-width
+    def nearest_road(self, x, y, r=8, max_r=512):
+        scalar = np.ndim(x) == 0
+        x = np.clip(np.atleast_1d(x), 0, self.width - 1)
+        y = np.clip(np.atleast_1d(y), 0, self.height - 1)
+        px, qy = x.copy(), y.copy()
+        for k in range(len(x)):
+            radius = r
+            while True:
+                road = self.road.padded(y[k] - radius, y[k] + radius + 1,
+                                        x[k] - radius, x[k] + radius + 1)
+                q, p = np.nonzero(road)
+                d = (q - radius) ** 2 + (p - radius) ** 2
+                if len(d) and (d.min() <= radius ** 2 or radius >= max_r):
+                    i = np.argmin(d)
+                    px[k], qy[k] = x[k] + p[i] - radius, y[k] + q[i] - radius
+                    break
+                if radius >= max_r:
+                    break
+                radius *= 4
+        return (px[0], qy[0]) if scalar else (px, qy)
+
+
+# Splits an image into a tiled map directory that TiledMap can read.
+def split(image_file, out_dir, tile_size=1024, pattern='{row}_{col}.png'):
+    image = cv2.imread(image_file)
+    height, width = image.shape[:2]
+    os.makedirs(out_dir, exist_ok=True)
+    for row in range(math.ceil(height / tile_size)):
+        for col in range(math.ceil(width / tile_size)):
+            tile = np.full((tile_size, tile_size, 3), 255, dtype=np.uint8)
+            part = image[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+            tile[:part.shape[0], :part.shape[1]] = part
+            # blank tiles are left out
+            if np.any(tile != 255):
+                cv2.imwrite(os.path.join(out_dir, pattern.format(row=row, col=col)), tile)
+    with open(os.path.join(out_dir, TILES), 'w') as f:
+        json.dump({'height': height, 'width': width, 'tile_size': tile_size,
+                   'pattern': pattern}, f, indent=2)
+    return out_dir
+
+
+if __name__ == '__main__':
+    # python -m trafficsim.tiles maps/map4.png maps/map4_tiles [tile size]
+    split(sys.argv[1], sys.argv[2], *map(int, sys.argv[3:4]))